@@ -0,0 +1,364 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tempfile
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+import buscar_planos_amil
+import buscar_planos_santa_helena
+import buscar_rede_credenciada
+from snapshot_tabelas import ler_snapshot, salvar_snapshot
+
+# -----------------------
+# Benchmark do preparo/cotação/rede com planilhas sintéticas
+# -----------------------
+# Gera planilhas com o layout exato de cada tabela (Amil, Santa Helena, rede),
+# grava em arquivos locais (snapshot .npz; .xlsx opcional) e cronometra
+# preparar_df_planos, buscar_planos (orçamento e catálogo) e
+# buscar_rede_credenciada. Nada passa por SFTP.
+#
+#   python benchmark_cotacao.py --linhas 10000 100000 1000000 --saida bench.json
+#
+# A saída é um JSON (uma entrada por caso x tamanho) para comparar entre versões;
+# o progresso vai para o stderr.
+LINHAS_PADRAO = [10_000, 100_000]
+REPETICOES_PADRAO = 5
+LIMITE_XLSX = 1_048_575  # linhas de dados que cabem numa aba do Excel
+
+REGIOES = [
+    "INTERIOR SP - 1", "INTERIOR SP - 2", "BAHIA", "CEARÁ", "DISTRITO FEDERAL",
+    "GOIÁS", "MARANHÃO", "MINAS GERAIS", "PARAÍBA", "PARANÁ", "PERNAMBUCO",
+    "RIO DE JANEIRO", "RIO GRANDE DO SUL", "RIO GRANDE DO NORTE", "SANTA CATARINA", "SÃO PAULO",
+]
+PORTES = ["MEI", "Demais Empresas", "Livre Adesão", "Compulsório"]
+VIDAS_PORTE = ["1 a 29", "2 a 29", "30 a 99", "30 a 99"]
+ACOMODACOES = ["QC", "QP"]
+FAIXAS = ["0-18", "19-23", "24-28", "29-33", "34-38", "39-43", "44-48", "49-53", "54-58", "59+"]
+COPARTS = ["Com coparticipação30", "Sem coparticipação"]
+
+ESTADOS_REDE = {
+    "Norte": {"Acre": ["Rio Branco", "Cruzeiro do Sul"], "Amazonas": ["Manaus", "Parintins"], "Pará": ["Belém", "Santarém"]},
+    "Nordeste": {"Bahia": ["Salvador", "Feira de Santana"], "Ceará": ["Fortaleza", "Sobral"], "Pernambuco": ["Recife", "Olinda"]},
+    "Sudeste": {"São Paulo": ["São Paulo", "Campinas", "Santos", "Diadema"], "Rio de Janeiro": ["Rio de Janeiro", "Niterói"],
+                "Minas Gerais": ["Belo Horizonte", "Uberlândia"]},
+    "Sul": {"Paraná": ["Curitiba", "Londrina"], "Santa Catarina": ["Florianópolis", "Joinville"], "Rio Grande do Sul": ["Porto Alegre"]},
+    "Centro-Oeste": {"Goiás": ["Goiânia"], "Distrito Federal": ["Brasília"]},
+}
+LINHAS_REDE = ["Linha Amil", "Linha Selecionada", "Linha Santa Helena"]
+TIPOS_REDE = ["Nacional", "Regional"]
+PRODUTOS_REDE = ["Hospital", "Laboratório", "Pronto Socorro", "Maternidade", "Clínica"]
+PLANOS_REDE = ["Amil S380", "Amil S450", "Amil S750", "Amil One S1500", "Amil Bronze", "Amil Prata"]
+MODALIDADES_REDE = ["Eletivo", "Urgência", "Internação", "Ambulatorial"]
+
+
+# -----------------------
+# Planilhas sintéticas
+# -----------------------
+def _precos_texto(valores: np.ndarray) -> np.ndarray:
+    # "R$ 1.234,56" como vem digitado em parte da planilha
+    return np.array(
+        [f"R$ {v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") for v in valores],
+        dtype=object,
+    )
+
+
+def gerar_planilha_planos(linhas: int, colunas: dict, seed: int = 0, fracao_texto: float = 0.1) -> pd.DataFrame:
+    """
+    Tabela de preços com `linhas` linhas: cada plano cobre todas as
+    regiões x portes x acomodações x faixas (a última fica incompleta).
+    colunas: nome lógico -> coluna da planilha (esquema da Operadora).
+    """
+    rng = np.random.default_rng(seed)
+    i = np.arange(linhas)
+
+    faixa = i % len(FAIXAS)
+    resto = i // len(FAIXAS)
+    acomodacao = resto % len(ACOMODACOES)
+    resto //= len(ACOMODACOES)
+    porte = resto % len(PORTES)
+    resto //= len(PORTES)
+    regiao = resto % len(REGIOES)
+    plano = resto // len(REGIOES)
+
+    nomes_planos = np.array([f"Plano {p}" for p in range(int(plano.max()) + 1 if linhas else 0)], dtype=object)
+
+    preco = np.round(rng.uniform(100, 3000, linhas), 2).astype(object)
+    texto = np.flatnonzero(rng.random(linhas) < fracao_texto)
+    preco[texto] = _precos_texto(preco[texto].astype(float))
+
+    return pd.DataFrame({
+        colunas["plano"]: nomes_planos[plano],
+        colunas["acomodacao"]: np.array(ACOMODACOES, dtype=object)[acomodacao],
+        colunas["faixa"]: np.array(FAIXAS, dtype=object)[faixa],
+        colunas["regiao"]: np.array(REGIOES, dtype=object)[regiao],
+        colunas["porte"]: np.array(PORTES, dtype=object)[porte],
+        colunas["preco"]: preco,
+        colunas["vidas"]: np.array(VIDAS_PORTE, dtype=object)[porte],
+        colunas["copart"]: np.array(COPARTS, dtype=object)[plano % len(COPARTS)],
+    })
+
+
+def gerar_planilha_amil(linhas: int, seed: int = 0) -> pd.DataFrame:
+    return gerar_planilha_planos(linhas, buscar_planos_amil.OPERADORA.colunas, seed=seed)
+
+
+def gerar_planilha_santa_helena(linhas: int, seed: int = 0) -> pd.DataFrame:
+    return gerar_planilha_planos(linhas, buscar_planos_santa_helena.OPERADORA.colunas, seed=seed)
+
+
+def gerar_planilha_rede(linhas: int, seed: int = 0) -> pd.DataFrame:
+    """Rede credenciada com o layout lido pelo buscar_rede_credenciada."""
+    rng = np.random.default_rng(seed)
+
+    cidades = [
+        (regiao, estado, cidade)
+        for regiao, estados in ESTADOS_REDE.items()
+        for estado, lista in estados.items()
+        for cidade in lista
+    ]
+    regioes, estados, nomes_cidades = (np.array(c, dtype=object) for c in zip(*cidades))
+
+    # ~1 prestador para cada 20 linhas, cada um preso a uma cidade
+    n_prest = max(1, linhas // 20)
+    prestador = rng.integers(0, n_prest, linhas)
+    local = prestador % len(cidades)
+    nomes_prest = np.array(
+        [f"{PRODUTOS_REDE[p % len(PRODUTOS_REDE)]} São Lucas {p}" for p in range(n_prest)], dtype=object
+    )
+
+    def escolher(valores):
+        return np.array(valores, dtype=object)[rng.integers(0, len(valores), linhas)]
+
+    return pd.DataFrame({
+        buscar_rede_credenciada.COD_LINHA: escolher(LINHAS_REDE),
+        buscar_rede_credenciada.COD_TIPO_REDE: escolher(TIPOS_REDE),
+        buscar_rede_credenciada.COD_REGIAO: regioes[local],
+        buscar_rede_credenciada.COD_ESTADO: estados[local],
+        buscar_rede_credenciada.COD_CIDADE: nomes_cidades[local],
+        buscar_rede_credenciada.COD_PRODUTO: escolher(PRODUTOS_REDE),
+        buscar_rede_credenciada.COD_PLANO: escolher(PLANOS_REDE),
+        buscar_rede_credenciada.COD_PRESTADOR: nomes_prest[prestador],
+        buscar_rede_credenciada.COD_MODALIDADE: escolher(MODALIDADES_REDE),
+    })
+
+
+GERADORES = {
+    "amil": gerar_planilha_amil,
+    "santa_helena": gerar_planilha_santa_helena,
+    "rede": gerar_planilha_rede,
+}
+
+
+def planilha_local(tabela: str, linhas: int, pasta: str, seed: int = 0, xlsx: bool = False) -> dict:
+    """
+    Gera (ou reaproveita) a planilha sintética em disco.
+    -> {"npz": caminho, "xlsx": caminho ou None}
+    """
+    os.makedirs(pasta, exist_ok=True)
+    base = os.path.join(pasta, f"{tabela}_{linhas}_{seed}")
+    caminhos = {"npz": base + ".npz", "xlsx": None}
+
+    df = None
+    if not os.path.exists(caminhos["npz"]):
+        df = GERADORES[tabela](linhas, seed=seed)
+        salvar_snapshot(df, caminhos["npz"])
+
+    if xlsx and linhas <= LIMITE_XLSX:
+        caminhos["xlsx"] = base + ".xlsx"
+        if not os.path.exists(caminhos["xlsx"]):
+            df = ler_snapshot(caminhos["npz"]) if df is None else df
+            df.to_excel(caminhos["xlsx"], index=False)
+    return caminhos
+
+
+# -----------------------
+# Medição
+# -----------------------
+def cronometrar(func, repeticoes: int, antes=None) -> dict:
+    """Roda func `repeticoes` vezes (antes() fora do tempo). -> estatísticas em segundos"""
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        if antes is not None:
+            antes()
+        inicio = time.perf_counter()
+        resultado = func()
+        tempos.append(time.perf_counter() - inicio)
+
+    tempos_ord = sorted(tempos)
+    return {
+        "repeticoes": repeticoes,
+        "min_s": tempos_ord[0],
+        "mediana_s": statistics.median(tempos_ord),
+        "media_s": statistics.fmean(tempos_ord),
+        "max_s": tempos_ord[-1],
+        "resultados": len(resultado) if hasattr(resultado, "__len__") else None,
+    }
+
+
+PAYLOAD_ORCAMENTO = {
+    "regiao": "BAHIA",
+    "porte_empresarial": "Demais Empresas",
+    "faixa_etaria": ["29-33", "59+", "0-18"],
+    "vidas": "7",
+    "valor_estimado": "7000,00",
+}
+PAYLOAD_CATALOGO = {
+    "regiao": "BAHIA",
+    "porte_empresarial": "Demais Empresas",
+    "faixa_etaria": ["29-33", "59+", "0-18"],
+    "vidas": "7",
+}
+PAYLOADS_REDE = {
+    "rede_estado_cidade": {"estado": "São Paulo", "cidade": "Campinas"},
+    "rede_plano_tipo": {"plano": "Amil S450", "tipo_rede": "Nacional", "regiao": "Sudeste"},
+    "rede_busca_livre": {"q": "sao lucas 1"},
+}
+
+
+def _casos_planos(modulo, df_raw: pd.DataFrame, repeticoes: int):
+    operadora = modulo.OPERADORA
+    yield "preparar_df_planos", lambda: cronometrar(lambda: modulo.preparar_df_planos(df_raw), repeticoes)
+
+    df = modulo.preparar_df_planos(df_raw)
+    # DataFrame novo a cada repetição (senão a tabela memorizada volta sem montar nada),
+    # copiado no antes(): só a montagem do índice/matriz entra no tempo
+    entrada = {}
+
+    def nova_copia():
+        entrada["df"] = df.copy()
+
+    yield "montar_indice", lambda: cronometrar(
+        lambda: operadora.tabela(df=entrada["df"]).indice.codigos, repeticoes, antes=nova_copia
+    )
+
+    tabela = operadora.tabela(df=df)
+    for nome, payload in [("buscar_planos_orcamento", PAYLOAD_ORCAMENTO), ("buscar_planos_catalogo", PAYLOAD_CATALOGO)]:
+        # cache limpo a cada repetição: mede a cotação, não o acerto de cache
+        yield nome, lambda p=payload: cronometrar(
+            lambda: operadora.cotar(p, tabela=tabela), repeticoes, antes=operadora.cache.limpar
+        )
+        yield nome + "_top10", lambda p=payload: cronometrar(
+            lambda: operadora.cotar(p, tabela=tabela, limit=10), repeticoes, antes=operadora.cache.limpar
+        )
+
+
+def _casos_rede(df_raw: pd.DataFrame, repeticoes: int):
+    yield "preparar_df_rede", lambda: cronometrar(lambda: buscar_rede_credenciada.preparar_df_rede(df_raw), repeticoes)
+
+    df = buscar_rede_credenciada.preparar_df_rede(df_raw)
+    for nome, payload in PAYLOADS_REDE.items():
+        yield nome, lambda p=payload: cronometrar(
+            lambda: buscar_rede_credenciada.buscar_rede_credenciada(p, df=df), repeticoes
+        )
+
+
+def rodar_benchmark(
+    linhas: list = None,
+    tabelas: list = None,
+    repeticoes: int = REPETICOES_PADRAO,
+    pasta: str = None,
+    seed: int = 0,
+    xlsx: bool = False,
+    casos: list = None,
+) -> dict:
+    """
+    Mede cada caso para cada tamanho/tabela.
+    casos: só os casos com esses nomes (None = todos).
+    -> {"ambiente": {...}, "resultados": [{tabela, linhas, caso, min_s, ...}]}
+    """
+    linhas = linhas or LINHAS_PADRAO
+    tabelas = tabelas or list(GERADORES)
+    pasta = pasta or os.path.join(tempfile.gettempdir(), "benchmark_cotacao")
+
+    resultados = []
+
+    def registrar(tabela, n, caso, medir):
+        if casos and caso not in casos:
+            return
+        try:
+            r = medir()
+        except Exception as e:
+            r = {"erro": f"{type(e).__name__}: {e}"}
+        r = {"tabela": tabela, "linhas": n, "caso": caso, **r}
+        resultados.append(r)
+        if "erro" in r:
+            print(f"[ERRO] {tabela} {n} {caso}: {r['erro']}", file=sys.stderr)
+        else:
+            print(f"[INFO] {tabela:>12} {n:>10} {caso:<28} mediana {r['mediana_s'] * 1e3:10.2f} ms", file=sys.stderr)
+
+    for n in linhas:
+        for tabela in tabelas:
+            caminhos = planilha_local(tabela, n, pasta, seed=seed, xlsx=xlsx)
+
+            registrar(tabela, n, "ler_planilha_npz", lambda: cronometrar(lambda: ler_snapshot(caminhos["npz"]), repeticoes))
+            if caminhos["xlsx"]:
+                registrar(tabela, n, "ler_planilha_xlsx", lambda: cronometrar(
+                    lambda: pd.read_excel(caminhos["xlsx"], sheet_name="Sheet1"), repeticoes
+                ))
+
+            df_raw = ler_snapshot(caminhos["npz"])
+            if tabela == "rede":
+                geradores_casos = _casos_rede(df_raw, repeticoes)
+            else:
+                modulo = buscar_planos_amil if tabela == "amil" else buscar_planos_santa_helena
+                geradores_casos = _casos_planos(modulo, df_raw, repeticoes)
+
+            for caso, medir in geradores_casos:
+                registrar(tabela, n, caso, medir)
+
+    return {"ambiente": ambiente(seed), "resultados": resultados}
+
+
+def ambiente(seed: int = 0) -> dict:
+    return {
+        "data": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "plataforma": platform.platform(),
+        "processador": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "seed": seed,
+    }
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Benchmark de preparo/cotação/rede com planilhas sintéticas")
+    parser.add_argument("--linhas", type=int, nargs="+", default=LINHAS_PADRAO, help="tamanhos das planilhas (ex.: 10000 10000000)")
+    parser.add_argument("--tabelas", nargs="+", choices=list(GERADORES), help="tabelas a medir (padrão: todas)")
+    parser.add_argument("--casos", nargs="+", help="só esses casos (ex.: buscar_planos_orcamento)")
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES_PADRAO)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pasta", help="onde guardar as planilhas geradas (reaproveitadas entre execuções)")
+    parser.add_argument("--xlsx", action="store_true", help="também grava/lê .xlsx (até o limite de linhas do Excel)")
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args(argv)
+
+    relatorio = rodar_benchmark(
+        linhas=args.linhas,
+        tabelas=args.tabelas,
+        repeticoes=args.repeticoes,
+        pasta=args.pasta,
+        seed=args.seed,
+        xlsx=args.xlsx,
+        casos=args.casos,
+    )
+
+    texto = json.dumps(relatorio, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto)
+        print(f"[INFO] Resultados em {args.saida}", file=sys.stderr)
+    else:
+        sys.stdout.write(texto + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import heapq
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+import buscar_planos_amil
+import buscar_planos_santa_helena
+from trace_cotacao import TraceCotacao
+
+# -----------------------
+# Cotação em todas as operadoras de uma vez
+# -----------------------
+# Cada operadora cota na sua thread (contra a tabela já carregada) e os
+# rankings, já ordenados, são intercalados num só (heapq.merge).
+# Os tetos (e o desempate) variam por operadora, então a chave de intercalação
+# é comum a todas: (|teto - soma| / teto, -soma) com orçamento, (soma, -soma)
+# no catálogo. Dentro de uma operadora ela segue a ordem do próprio ranking.
+OPERADORAS = {
+    buscar_planos_amil.OPERADORA.nome: buscar_planos_amil.OPERADORA,
+    buscar_planos_santa_helena.OPERADORA.nome: buscar_planos_santa_helena.OPERADORA,
+}
+
+# pools separados: uma recarga (SFTP + preparo, segundos) não ocupa as
+# threads das cotações (milissegundos)
+_EXECUTOR = ThreadPoolExecutor(max_workers=len(OPERADORAS), thread_name_prefix="operadora")
+_EXECUTOR_CARGA = ThreadPoolExecutor(max_workers=len(OPERADORAS), thread_name_prefix="carga")
+
+
+def carregar_tabelas(nomes: list = None) -> dict:
+    """Carrega (ou reaproveita) a tabela de cada operadora, em paralelo. -> {nome: TabelaPlanos}"""
+    nomes = list(nomes or OPERADORAS)
+    futuros = {nome: _EXECUTOR_CARGA.submit(OPERADORAS[nome].carregar_tabela) for nome in nomes}
+    return {nome: f.result() for nome, f in futuros.items()}
+
+
+def buscar_planos(
+    payload: dict,
+    debug: bool = False,
+    tabelas: dict = None,
+    nomes: list = None,
+    limit: int = None,
+    offset: int = 0,
+):
+    """
+    Cota o payload em todas as operadoras (ou só em `nomes`) ao mesmo tempo.
+    -> um ranking só, cada resultado com "operadora": mais perto do teto (relativo)
+       primeiro, empate -> maior soma, depois a ordem de OPERADORAS.
+
+    tabelas: {nome: TabelaPlanos} já carregadas (carregar_tabelas); sem elas
+             cada operadora usa/carrega a sua.
+    Operadora que falhar fica de fora do ranking (o erro é impresso).
+    """
+    trace = TraceCotacao("buscar_planos:todas")
+    nomes = list(nomes or OPERADORAS)
+    tabelas = tabelas or {}
+    fim_pagina = None if limit is None else offset + limit
+
+    def cotar(nome):
+        # cada operadora já devolve só o seu top (offset + limit)
+        operadora = OPERADORAS[nome]
+        return operadora.cotar(
+            payload, debug=debug, tabela=tabelas.get(nome), limit=fim_pagina, com_chave=True
+        )
+
+    futuros = [(nome, _EXECUTOR.submit(cotar, nome)) for nome in nomes]
+
+    rankings = []
+    for nome, futuro in futuros:
+        try:
+            itens = futuro.result()
+        except Exception as e:
+            print(f"[ERRO] Cotação {nome} falhou: {type(e).__name__}: {e}")
+            continue
+        rankings.append([(chave, {"operadora": nome, **r}) for chave, r in itens])
+
+    # (cada operadora registra as próprias etapas no agregador)
+    trace.marcar("operadoras", sum(len(r) for r in rankings))
+
+    intercalado = heapq.merge(*rankings, key=lambda item: item[0])
+    resultado = [r for _, r in islice(intercalado, offset, fim_pagina)]
+    trace.marcar("intercalacao", len(resultado))
+    trace.finalizar()
+    return resultado
+
+
+if __name__ == "__main__":
+    payload = {
+        "regiao": "BAHIA",
+        "porte_empresarial": "Demais Empresas",
+        "faixa_etaria": ["29-33", "59+"],
+        "vidas": "7",
+        "valor_estimado": "7000,00"
+    }
+
+    print(buscar_planos(payload=payload, debug=True, limit=10))
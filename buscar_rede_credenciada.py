@@ -1,12 +1,15 @@
 import os
 import io
 import re
+import sys
+import bisect
 import numpy as np
 import pandas as pd
-import paramiko
 import unicodedata
 from urllib.parse import urlparse
 from dotenv import load_dotenv
+from sftp_utils import ler_excel_sftp_cache, executar_sftp, baixar_sftp, marcar_download
+from trace_cotacao import TraceCotacao, TRACE_NULO
 
 # ===============================
 # CONFIG FIXA (infraestrutura)
@@ -38,18 +41,49 @@ def _norm(x):
     return s.upper()
 
 
-def _contains(series, value):
-    v = _norm(value)
-    if not v:
-        return np.ones(len(series), dtype=bool)
-    return series.str.contains(re.escape(v), na=False)
+# ===============================
+# Índice de trigramas (busca por substring)
+# ===============================
+# Montado sobre os valores normalizados distintos de cada coluna (não sobre as
+# linhas). Uma busca por substring vira interseção das listas dos trigramas do
+# termo -> poucos valores candidatos -> confirmação com `in` só neles.
+_REGEX_ESPECIAIS = set(".^$*+?{}[]\\|()")
 
 
-def _equals(series, value):
-    v = _norm(value)
-    if not v:
-        return np.ones(len(series), dtype=bool)
-    return series == v
+def _trigramas(texto: str) -> set:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceTrigramas:
+    """trigrama -> códigos (int32, crescentes) dos valores que o contêm"""
+
+    def __init__(self, valores):
+        self.valores = list(valores)
+        postings = {}
+        for codigo, texto in enumerate(self.valores):
+            for tri in _trigramas(texto):
+                postings.setdefault(tri, []).append(codigo)
+        self.postings = {tri: np.array(cods, dtype=np.int32) for tri, cods in postings.items()}
+
+    def codigos_contendo(self, termo: str) -> np.ndarray:
+        """Códigos dos valores que contêm termo (substring literal)."""
+        tris = _trigramas(termo)
+        if not tris:
+            # termo curto (< 3): sem trigrama para filtrar, confere todos
+            candidatos = range(len(self.valores))
+        else:
+            # interseção começando pela lista mais curta
+            listas = sorted((self.postings.get(t) for t in tris), key=lambda x: -1 if x is None else len(x))
+            if listas[0] is None:
+                return np.zeros(0, dtype=np.int32)
+            candidatos = listas[0]
+            for lista in listas[1:]:
+                candidatos = np.intersect1d(candidatos, lista, assume_unique=True)
+                if candidatos.size == 0:
+                    return candidatos
+            candidatos = candidatos.tolist()
+
+        return np.array([c for c in candidatos if termo in self.valores[c]], dtype=np.int32)
 
 
 # ===============================
@@ -60,7 +94,7 @@ def _parse_sftp_url(url):
     return u.hostname, u.port or 22, u.username, u.path
 
 
-def _ler_excel_sftp():
+def _ler_excel_sftp(usar_cache: bool = True, versao_atual=None, trace=TRACE_NULO):
     load_dotenv()
     password = os.getenv("PASSWORD_ADMIN_SFTP")
     if not password:
@@ -68,24 +102,389 @@ def _ler_excel_sftp():
 
     host, port, user, path = _parse_sftp_url(SFTP_URL)
 
-    transport = paramiko.Transport((host, port))
-    transport.connect(username=user, password=password)
-    sftp = paramiko.SFTPClient.from_transport(transport)
+    def ler(sftp):
+        # cache local: só baixa/parseia de novo se mtime/size mudarem no servidor
+        if usar_cache:
+            # o DataFrame cru não fica em memória: a tabela compacta substitui
+            # (None = planilha na versao_atual, nada a ler)
+            return ler_excel_sftp_cache(sftp, path, sheet_name=SHEET_NAME, em_memoria=False,
+                                        versao_atual=versao_atual, trace=trace)
+
+        download = baixar_sftp(sftp, path)
+        marcar_download(trace, download)
+        df = pd.read_excel(io.BytesIO(download["dados"]), sheet_name=SHEET_NAME)
+        df.columns = [c.strip() for c in df.columns]
+        trace.marcar("parse_excel", len(df))
+        return df
+
+    # conexão do pool compartilhado com as tabelas de planos
+    return executar_sftp(host, port, user, password, ler, trace=trace)
+
+
+# ===============================
+# Tabela preparada (carregada uma vez)
+# ===============================
+# Formato compacto: cada coluna vira um código inteiro por linha (uint8/16/32)
+# + dicionário dos valores crus distintos + dicionário dos normalizados. Texto
+# cru/normalizado só existe nos dicionários; os filtros resolvem o termo no
+# dicionário e voltam para as linhas por indexação dos códigos.
+COLUNAS_REDE = [
+    COD_LINHA, COD_TIPO_REDE, COD_REGIAO, COD_ESTADO, COD_CIDADE,
+    COD_PRODUTO, COD_PLANO, COD_MODALIDADE, COD_PRESTADOR,
+]
+COLUNAS_BUSCA_LIVRE = [COD_PRESTADOR, COD_PLANO, COD_PRODUTO]
+COLUNAS_GRUPO = [COD_PLANO, COD_PRODUTO, COD_MODALIDADE]
+
+# autocomplete: campo -> coluna
+CAMPOS_AUTOCOMPLETE = {"cidade": COD_CIDADE, "prestador": COD_PRESTADOR, "plano": COD_PLANO}
+LIMITE_AUTOCOMPLETE = 10
+
+# facetas (barra de filtros): campo -> coluna
+FACETAS = {"estado": COD_ESTADO, "cidade": COD_CIDADE, "tipo_rede": COD_TIPO_REDE, "modalidade": COD_MODALIDADE}
+
+# chave da resposta -> coluna (atributos tirados da primeira linha do grupo)
+CAMPOS_RESPOSTA = {
+    "plano": COD_PLANO,
+    "produto": COD_PRODUTO,
+    "modalidade": COD_MODALIDADE,
+    "regiao": COD_REGIAO,
+    "estado": COD_ESTADO,
+    "cidade": COD_CIDADE,
+    "tipo_rede": COD_TIPO_REDE,
+    "linha": COD_LINHA,
+}
+
+
+def _distintos(x: np.ndarray) -> np.ndarray:
+    # np.unique de inteiros por ordenação (o caminho por hash do NumPy 2 é mais lento aqui)
+    x = np.sort(x)
+    novo = np.ones(len(x), dtype=bool)
+    novo[1:] = x[1:] != x[:-1]
+    return x[novo]
+
+
+def _dtype_codigos(n: int):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n <= np.iinfo(dtype).max + 1:
+            return dtype
+    return np.int64
+
+
+class ColunaRede:
+    """
+    codigos[linha] -> valores (cru, NaN incluído como valor)
+    norm_de_valor[código cru] -> normalizados (_norm uma vez por valor distinto;
+    crus diferentes podem normalizar igual: "São Paulo" / "SAO PAULO")
+    ordem[código cru] -> posição do valor cru em ordem crescente (-1: nulo)
+    """
+
+    def __init__(self, series):
+        codigos, valores = pd.factorize(series, use_na_sentinel=False)
+        cod_norm, normalizados = pd.factorize(pd.Series([_norm(v) for v in valores], dtype=object))
+        self.codigos = codigos.astype(_dtype_codigos(len(valores)))
+        self.valores = np.asarray(valores, dtype=object)
+        self.norm_de_valor = cod_norm.astype(np.int32)
+        self.normalizados = [str(v) for v in normalizados]
+        self.posicao = {v: i for i, v in enumerate(self.normalizados)}
+        self.ordem = pd.factorize(self.valores, sort=True)[0].astype(np.int32)
+        self._indice = None
+        self._ordenados = None
+        self._exibicao = None
+
+    @property
+    def indice(self) -> IndiceTrigramas:
+        if self._indice is None:
+            self._indice = IndiceTrigramas(self.normalizados)
+        return self._indice
+
+    def _linhas(self, casa: np.ndarray) -> np.ndarray:
+        # bool por valor normalizado -> bool por linha
+        return casa[self.norm_de_valor][self.codigos]
+
+    def contem(self, termo: str) -> np.ndarray:
+        casa = np.zeros(len(self.normalizados), dtype=bool)
+        casa[self.indice.codigos_contendo(termo)] = True
+        return self._linhas(casa)
+
+    def contem_regex(self, padrao: str) -> np.ndarray:
+        rx = re.compile(padrao)
+        casa = np.array([rx.search(v) is not None for v in self.normalizados], dtype=bool)
+        return self._linhas(casa)
+
+    def igual(self, termo: str) -> np.ndarray:
+        cod = self.posicao.get(termo)
+        if cod is None:
+            return np.zeros(len(self.codigos), dtype=bool)
+        crus = np.flatnonzero(self.norm_de_valor == cod)
+        if len(crus) == 1:
+            return self.codigos == crus[0]
+        return np.isin(self.codigos, crus)
+
+    def valores_linhas(self, linhas) -> np.ndarray:
+        return self.valores[self.codigos[linhas]]
+
+    @property
+    def ordenados(self):
+        """(normalizados não vazios em ordem crescente, códigos deles) -> busca binária de prefixo"""
+        if self._ordenados is None:
+            cods = sorted((i for i, v in enumerate(self.normalizados) if v), key=self.normalizados.__getitem__)
+            self._ordenados = ([self.normalizados[i] for i in cods], np.array(cods, dtype=np.int32))
+        return self._ordenados
+
+    @property
+    def exibicao(self) -> np.ndarray:
+        """Por código normalizado: a grafia crua mais frequente (empate: a primeira da planilha)."""
+        if self._exibicao is None:
+            freq = np.bincount(self.codigos, minlength=len(self.valores))
+            ordem = np.lexsort((np.arange(len(freq)), -freq, self.norm_de_valor))
+            norm = self.norm_de_valor[ordem]
+            primeiro = np.ones(len(ordem), dtype=bool)
+            primeiro[1:] = norm[1:] != norm[:-1]
+            self._exibicao = self.valores[ordem[primeiro]]
+        return self._exibicao
+
+    def prefixo(self, prefixo: str) -> np.ndarray:
+        """Códigos normalizados que começam com prefixo, em ordem alfabética."""
+        chaves, cods = self.ordenados
+        ini = bisect.bisect_left(chaves, prefixo)
+        fim = bisect.bisect_left(chaves, prefixo + "\U0010ffff", ini)
+        return cods[ini:fim]
+
+    @property
+    def nbytes(self) -> int:
+        textos = sum(sys.getsizeof(v) for v in self.valores) + sum(sys.getsizeof(v) for v in self.normalizados)
+        return self.codigos.nbytes + self.norm_de_valor.nbytes + self.ordem.nbytes + textos
+
+
+class TabelaRede:
+    """Rede credenciada compacta: só as colunas usadas, uma ColunaRede cada."""
+
+    def __init__(self, df):
+        self.colunas = {col: ColunaRede(df[col]) for col in COLUNAS_REDE}
+        self._combos = {}
+        self.versao = df.attrs.get("versao_planilha")
+        self.linhas = len(df)
+
+    def __len__(self):
+        return self.linhas
+
+    def __getitem__(self, col: str) -> ColunaRede:
+        return self.colunas[col]
+
+    def montar_indices(self):
+        for coluna in self.colunas.values():
+            coluna.indice
+        for col in CAMPOS_AUTOCOMPLETE.values():
+            self[col].ordenados
+            self[col].exibicao
+            self._combinacoes(col)
+
+    def _combinacoes(self, col: str):
+        """
+        (estado, linha, col) normalizados distintos da planilha, ordenados por
+        estado -> arrays E, L, C. Restringir o autocomplete a um Estado/Linha
+        olha só essas combinações, não as linhas.
+        """
+        comb = self._combos.get(col)
+        if comb is None:
+            e, l, c = self[COD_ESTADO], self[COD_LINHA], self[col]
+            n_l, n_c = len(l.normalizados), len(c.normalizados)
+            chave = (
+                e.norm_de_valor[e.codigos].astype(np.int64) * n_l
+                + l.norm_de_valor[l.codigos]
+            ) * n_c + c.norm_de_valor[c.codigos]
+            u = np.unique(chave)
+            comb = (u // (n_l * n_c), (u // n_c) % n_l, u % n_c)
+            self._combos[col] = comb
+        return comb
+
+    def autocompletar(self, col: str, prefixo: str, estado=None, linha=None, limite: int = None) -> list:
+        """Grafias dos valores de col que começam com prefixo (já normalizado), em ordem alfabética."""
+        limite = LIMITE_AUTOCOMPLETE if limite is None else limite
+        coluna = self[col]
+        cods = coluna.prefixo(prefixo)
+
+        estado, linha = _norm(estado), _norm(linha)
+        if len(cods) and (estado or linha):
+            E, L, C = self._combinacoes(col)
+            if estado:
+                # mesma regra do filtro: Estado igual, Linha contém
+                cod_e = self[COD_ESTADO].posicao.get(estado)
+                if cod_e is None:
+                    return []
+                ini, fim = np.searchsorted(E, [cod_e, cod_e + 1])
+                L, C = L[ini:fim], C[ini:fim]
+            if linha:
+                C = C[np.isin(L, self[COD_LINHA].indice.codigos_contendo(linha))]
+            presente = np.zeros(len(coluna.normalizados), dtype=bool)
+            presente[C] = True
+            cods = cods[presente[cods]]
+
+        return coluna.exibicao[cods[:limite]].tolist()
 
+    def facetas(self, mask) -> dict:
+        """
+        {campo: {valor: prestadores distintos}} das linhas do mask, para cada
+        campo de FACETAS. Conta por código normalizado (bincount dos pares
+        valor x prestador distintos); maiores contagens primeiro, valor nulo fora.
+        """
+        linhas = np.flatnonzero(mask)
+        prest = self[COD_PRESTADOR]
+        p = prest.norm_de_valor[prest.codigos[linhas]].astype(np.int64)
+        vazio = prest.posicao.get("")
+        if vazio is not None:
+            linhas, p = linhas[p != vazio], p[p != vazio]
+        n_p = len(prest.normalizados)
+
+        colunas = [self[col] for col in FACETAS.values()]
+        codigos = [c.norm_de_valor[c.codigos[linhas]].astype(np.int64) for c in colunas]
+        tamanhos = [len(c.normalizados) for c in colunas]
+
+        # uma ordenação só: linhas -> combinações distintas (prestador, facetas...)
+        # (se a chave composta não couber em int64, conta direto sobre as linhas)
+        if n_p * int(np.prod(tamanhos, dtype=object)) < 2 ** 62:
+            chave = p
+            for f, n_f in zip(codigos, tamanhos):
+                chave = chave * n_f + f
+            chave = _distintos(chave)
+            for i in reversed(range(len(codigos))):
+                chave, codigos[i] = np.divmod(chave, tamanhos[i])
+            p = chave
+
+        saida = {}
+        for campo, coluna, f, n_f in zip(FACETAS, colunas, codigos, tamanhos):
+            pares = _distintos(f * n_p + p)
+            contagem = np.bincount(pares // n_p, minlength=n_f)
+            vazio_f = coluna.posicao.get("")
+            if vazio_f is not None:
+                contagem[vazio_f] = 0
+            cods = np.flatnonzero(contagem)
+            cods = cods[np.argsort(-contagem[cods], kind="stable")]
+            saida[campo] = dict(zip(coluna.exibicao[cods].tolist(), contagem[cods].tolist()))
+        return saida
+
+    def agrupar(self, mask) -> list:
+        """
+        Linhas do mask agrupadas por (Plano, Produto, Modalidade), como o antigo
+        groupby: grupos em ordem de chave (chave nula não forma grupo), atributos
+        da primeira linha do grupo, prestadores distintos ordenados.
+        Uma ordenação só (chaves + prestador) e fronteiras dos grupos; nenhum
+        DataFrame por grupo.
+        """
+        linhas = np.flatnonzero(mask)
+        chaves = [self[col].ordem[self[col].codigos[linhas]] for col in COLUNAS_GRUPO]
+        validas = np.logical_and.reduce([k >= 0 for k in chaves])
+        if not validas.all():
+            linhas = linhas[validas]
+            chaves = [k[validas] for k in chaves]
+        if len(linhas) == 0:
+            return []
+
+        prest = self[COD_PRESTADOR]
+        k_prest = prest.ordem[prest.codigos[linhas]]
+        # lexsort: última chave é a principal; estável -> linhas crescentes nos empates
+        ordem = np.lexsort((k_prest, *reversed(chaves)))
+        linhas = linhas[ordem]
+        k_prest = k_prest[ordem]
+
+        novo_grupo = np.zeros(len(linhas), dtype=bool)
+        novo_grupo[0] = True
+        for k in chaves:
+            k = k[ordem]
+            novo_grupo[1:] |= k[1:] != k[:-1]
+        inicios = np.flatnonzero(novo_grupo)
+        primeiras = np.minimum.reduceat(linhas, inicios)
+
+        # prestador não nulo e diferente do anterior dentro do grupo (já vem ordenado)
+        novo_prest = novo_grupo.copy()
+        novo_prest[1:] |= k_prest[1:] != k_prest[:-1]
+        manter = novo_prest & (k_prest >= 0)
+        nomes = prest.valores_linhas(linhas[manter])
+        fins = np.cumsum(np.add.reduceat(manter, inicios))
+
+        atributos = {campo: self[col].valores_linhas(primeiras) for campo, col in CAMPOS_RESPOSTA.items()}
+        resultado = []
+        ini = 0
+        for i, fim in enumerate(fins.tolist()):
+            item = {campo: valores[i] for campo, valores in atributos.items()}
+            item["prestadores"] = nomes[ini:fim].tolist()
+            resultado.append(item)
+            ini = fim
+        return resultado
+
+    @property
+    def nbytes(self) -> int:
+        return sum(c.nbytes for c in self.colunas.values())
+
+
+def preparar_df_rede(df) -> TabelaRede:
+    """Planilha crua da rede -> TabelaRede (o DataFrame pode ser descartado)."""
+    return TabelaRede(df)
+
+
+# DataFrame passado direto no buscar_rede_credenciada -> TabelaRede (última preparada,
+# por identidade; tupla trocada de uma vez: threads do serviço leem sem lock)
+_AVULSA = (None, None)
+
+
+def _tabela_rede(df) -> TabelaRede:
+    global _AVULSA
+    if isinstance(df, TabelaRede):
+        return df
+    df_avulso, tabela = _AVULSA
+    if df_avulso is not df:
+        tabela = preparar_df_rede(df)
+        _AVULSA = (df, tabela)
+    return tabela
+
+
+def _filtro_contem(tabela: TabelaRede, col: str, value):
+    v = _norm(value)
+    if not v:
+        return np.ones(len(tabela), dtype=bool)
+    return tabela[col].contem(v)
+
+
+def _filtro_igual(tabela: TabelaRede, col: str, value):
+    v = _norm(value)
+    if not v:
+        return np.ones(len(tabela), dtype=bool)
+    return tabela[col].igual(v)
+
+
+# tabela preparada da última carga (reaproveitada enquanto a planilha não mudar)
+_TABELA = {"versao": None, "tabela": None}
+
+
+def carregar_tabela_rede(trace: TraceCotacao = None):
+    """trace: recebe as etapas (sem ele, um trace próprio vai para o agregador)."""
+    proprio = trace is None
+    if proprio:
+        trace = TraceCotacao("carregar_tabela:rede")
     try:
-        with sftp.open(path, "rb") as f:
-            df = pd.read_excel(io.BytesIO(f.read()), sheet_name=SHEET_NAME)
-            df.columns = [c.strip() for c in df.columns]
-            return df
+        # compara a versão pelo stat remoto antes de carregar qualquer DataFrame
+        df_raw = _ler_excel_sftp(versao_atual=_TABELA["versao"], trace=trace)
+        if df_raw is None:
+            trace.marcar("tabela_reaproveitada")
+            return _TABELA["tabela"]
+
+        versao = df_raw.attrs.get("versao_planilha")
+        tabela = preparar_df_rede(df_raw)
+        trace.marcar("preparo", len(tabela), bytes=tabela.nbytes)
+        tabela.montar_indices()
+        trace.marcar("indice_trigramas")
+        _TABELA.update(versao=versao, tabela=tabela)
+        return tabela
     finally:
-        sftp.close()
-        transport.close()
+        if proprio:
+            trace.finalizar()
 
 
 # ===============================
 # Função pública
 # ===============================
-def buscar_rede_credenciada(payload: dict, debug: bool = False):
+def buscar_rede_credenciada(payload: dict, debug: bool = False, df=None, trace: TraceCotacao = None,
+                            facetas: bool = False):
     """
     Payload aceito:
     {
@@ -100,84 +499,110 @@ def buscar_rede_credenciada(payload: dict, debug: bool = False):
         "prestador",
         "q"
     }
+
+    df: TabelaRede (preparar_df_rede/carregar_tabela_rede) ou a planilha crua;
+        sem ela, carrega via SFTP.
+    facetas: devolve {"resultados": [...], "facetas": {campo: {valor: prestadores}}}
+        com as contagens do mesmo conjunto filtrado (estado, cidade, tipo_rede, modalidade).
+    trace: recebe tempo/linhas de cada etapa (sem ele, um trace próprio vai para o agregador).
     """
+    proprio = trace is None
+    if proprio:
+        trace = TraceCotacao("buscar_rede")
 
-    df = _ler_excel_sftp()
-
-    # Normaliza colunas
-    df["_LINHA"]     = df[COD_LINHA].apply(_norm)
-    df["_TIPO"]      = df[COD_TIPO_REDE].apply(_norm)
-    df["_REGIAO"]    = df[COD_REGIAO].apply(_norm)
-    df["_ESTADO"]    = df[COD_ESTADO].apply(_norm)
-    df["_CIDADE"]    = df[COD_CIDADE].apply(_norm)
-    df["_PRODUTO"]   = df[COD_PRODUTO].apply(_norm)
-    df["_PLANO"]     = df[COD_PLANO].apply(_norm)
-    df["_MODAL"]     = df[COD_MODALIDADE].apply(_norm)
-    df["_PREST"]     = df[COD_PRESTADOR].apply(_norm)
-
-    mask = np.ones(len(df), dtype=bool)
-
-    def step(m, label):
-        nonlocal mask
-        mask &= m
-        if debug:
-            print(f"[DEBUG] {label}: {mask.sum()}")
-
-    step(_contains(df["_LINHA"], payload.get("linha")), "LINHA")
-    step(_contains(df["_TIPO"], payload.get("tipo_rede")), "TIPO_REDE")
-    step(_contains(df["_REGIAO"], payload.get("regiao")), "REGIAO")
-    step(_equals(df["_ESTADO"], payload.get("estado")), "ESTADO")
-    step(_contains(df["_CIDADE"], payload.get("cidade")), "CIDADE")
-    step(_contains(df["_PRODUTO"], payload.get("produto")), "PRODUTO")
-    step(_contains(df["_PLANO"], payload.get("plano")), "PLANO")
-    step(_contains(df["_MODAL"], payload.get("modalidade")), "MODALIDADE")
-    step(_contains(df["_PREST"], payload.get("prestador")), "PRESTADOR")
-
-    q = payload.get("q")
-    if q:
-        qn = _norm(q)
-        step(
-            df["_PREST"].str.contains(qn) |
-            df["_PLANO"].str.contains(qn) |
-            df["_PRODUTO"].str.contains(qn),
-            "BUSCA_LIVRE"
-        )
-
-    base = df.loc[mask]
-
-    if base.empty:
-        return []
-
-    # Agrupamento final para API
-    resultado = []
-    for (plano, produto, modalidade), g in base.groupby([COD_PLANO, COD_PRODUTO, COD_MODALIDADE]):
-        resultado.append({
-            "plano": plano,
-            "produto": produto,
-            "modalidade": modalidade,
-            "regiao": g[COD_REGIAO].iloc[0],
-            "estado": g[COD_ESTADO].iloc[0],
-            "cidade": g[COD_CIDADE].iloc[0],
-            "tipo_rede": g[COD_TIPO_REDE].iloc[0],
-            "linha": g[COD_LINHA].iloc[0],
-            "prestadores": sorted(g[COD_PRESTADOR].dropna().unique().tolist())
-        })
-
-    return resultado
-
-
-plano: str
-estado: str
-regiao: str
-cidade: str
-tipo_rede: str
-
-payload = {
-    "plano" : "Amil S380",
-    "estado" : "Acre",
-    "regiao" : "Norte",
-    "cidade" : "Rio Branco",
-    "tipo_rede" : "Nacional"
-}
+    try:
+        if df is None:
+            df = carregar_tabela_rede(trace=trace)
+        tabela = _tabela_rede(df)
+
+        mask = np.ones(len(tabela), dtype=bool)
+
+        def step(m, label):
+            nonlocal mask
+            mask &= m
+            if debug or trace.ativo:
+                n = int(mask.sum())
+                if debug:
+                    print(f"[DEBUG] {label}: {n}")
+                trace.marcar(f"filtro_{label.lower()}", n)
+
+        step(_filtro_contem(tabela, COD_LINHA, payload.get("linha")), "LINHA")
+        step(_filtro_contem(tabela, COD_TIPO_REDE, payload.get("tipo_rede")), "TIPO_REDE")
+        step(_filtro_contem(tabela, COD_REGIAO, payload.get("regiao")), "REGIAO")
+        step(_filtro_igual(tabela, COD_ESTADO, payload.get("estado")), "ESTADO")
+        step(_filtro_contem(tabela, COD_CIDADE, payload.get("cidade")), "CIDADE")
+        step(_filtro_contem(tabela, COD_PRODUTO, payload.get("produto")), "PRODUTO")
+        step(_filtro_contem(tabela, COD_PLANO, payload.get("plano")), "PLANO")
+        step(_filtro_contem(tabela, COD_MODALIDADE, payload.get("modalidade")), "MODALIDADE")
+        step(_filtro_contem(tabela, COD_PRESTADOR, payload.get("prestador")), "PRESTADOR")
+
+        q = payload.get("q")
+        if q:
+            qn = _norm(q)
+            # q sempre foi regex: termo com metacaractere é avaliado como regex nos dicionários
+            regex = bool(_REGEX_ESPECIAIS & set(qn))
+            m_q = np.zeros(len(tabela), dtype=bool)
+            for col in COLUNAS_BUSCA_LIVRE:
+                m_q |= tabela[col].contem_regex(qn) if regex else tabela[col].contem(qn)
+            step(m_q, "BUSCA_LIVRE")
+
+        # Agrupamento final para API
+        resultado = tabela.agrupar(mask)
+        trace.marcar("agrupamento", len(resultado))
+
+        if facetas:
+            resultado = {"resultados": resultado, "facetas": tabela.facetas(mask)}
+            trace.marcar("facetas")
+
+        return resultado
+    finally:
+        if proprio:
+            trace.finalizar()
+
+
+def autocompletar(campo: str, prefixo: str, estado: str = None, linha: str = None,
+                  limite: int = LIMITE_AUTOCOMPLETE, df=None, trace: TraceCotacao = None):
+    """
+    Sugestões para o que o usuário está digitando em cidade/prestador/plano:
+    valores que começam com `prefixo` (mesmas regras do _norm: sem acento,
+    maiúsculas), em ordem alfabética, no máximo `limite` (None = LIMITE_AUTOCOMPLETE). estado/linha
+    restringem às combinações existentes na planilha.
+    Devolve a grafia da planilha (a mais frequente quando há várias).
+    """
+    col = CAMPOS_AUTOCOMPLETE.get(campo)
+    if col is None:
+        raise ValueError(f"campo deve ser um de {sorted(CAMPOS_AUTOCOMPLETE)}: {campo!r}")
+    if limite is not None and limite < 0:
+        raise ValueError("limite não pode ser negativo")
+
+    proprio = trace is None
+    if proprio:
+        trace = TraceCotacao("autocompletar_rede")
+    try:
+        if df is None:
+            df = carregar_tabela_rede(trace=trace)
+        tabela = _tabela_rede(df)
+        sugestoes = tabela.autocompletar(col, _norm(prefixo), estado=estado, linha=linha, limite=limite)
+        trace.marcar("autocompletar", len(sugestoes))
+        return sugestoes
+    finally:
+        if proprio:
+            trace.finalizar()
+
+
+if __name__ == "__main__":
+    plano: str
+    estado: str
+    regiao: str
+    cidade: str
+    tipo_rede: str
+
+    payload = {
+        "plano" : "Amil S380",
+        "estado" : "Acre",
+        "regiao" : "Norte",
+        "cidade" : "Rio Branco",
+        "tipo_rede" : "Nacional"
+    }
 
-print(buscar_rede_credenciada(payload=payload, debug=True))
\ No newline at end of file
+    print(buscar_rede_credenciada(payload=payload, debug=True))
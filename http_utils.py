@@ -0,0 +1,177 @@
+import time
+import random
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# -----------------------
+# HTTP dos scrapers (kitcorretoramil)
+# -----------------------
+# Uma Session com pool de conexões do tamanho do paralelismo: as requisições de
+# uma rodada saem em paralelo (no máximo max_paralelo ao mesmo tempo) e as
+# respostas voltam na ordem em que foram pedidas. Falha de rede/timeout, 429 e
+# 5xx são repetidos com backoff exponencial (com jitter).
+# Crawlers passam um LimitadorTaxa: ritmo (req/s) + máximo em voo, que cai
+# quando o site reclama e volta a subir com respostas saudáveis.
+MAX_PARALELO = 8
+TIMEOUT_HTTP = (10, 60)     # (conectar, ler) em segundos
+TENTATIVAS_HTTP = 4
+BACKOFF_HTTP = 0.5          # espera base; dobra a cada tentativa
+STATUS_REPETIR = {429, 500, 502, 503, 504}
+
+# limitador (crawlers): a taxa cai pela metade a cada problema (no máximo um
+# corte por JANELA_CORTE s) e sobe AUMENTO_TAXA req/s a cada resposta saudável
+TAXA_MIN = 0.5
+AUMENTO_TAXA = 0.1
+JANELA_CORTE = 1.0
+
+
+class LimitadorTaxa:
+    """
+    Token bucket (`taxa` req/s, rajada de até `rajada`) + no máximo
+    `max_em_voo` requisições ao mesmo tempo, compartilhado entre threads.
+    Adaptativo: falha() (429/5xx/timeout) corta a taxa pela metade e, com
+    Retry-After, pausa todo mundo; sucesso() devolve a taxa aos poucos até
+    taxa_max.
+    """
+
+    def __init__(self, taxa: float, max_em_voo: int, taxa_min: float = TAXA_MIN, rajada: float = None):
+        self.taxa = self.taxa_max = float(taxa)
+        self.taxa_min = min(taxa_min, self.taxa)
+        self.rajada = float(rajada) if rajada else max(1.0, self.taxa)
+        self.max_em_voo = max_em_voo
+        self._em_voo = threading.Semaphore(max_em_voo)
+        self._lock = threading.Lock()
+        self._fichas = 1.0  # começa sem rajada
+        self._ultimo = time.monotonic()
+        self._pausa_ate = 0.0
+        self._ultimo_corte = 0.0
+
+    def _pegar_ficha(self):
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._fichas = min(self.rajada, self._fichas + (agora - self._ultimo) * self.taxa)
+                self._ultimo = agora
+                espera = self._pausa_ate - agora
+                if espera <= 0:
+                    if self._fichas >= 1:
+                        self._fichas -= 1
+                        return
+                    espera = (1 - self._fichas) / self.taxa
+            time.sleep(espera)
+
+    @contextmanager
+    def vaga(self):
+        """Segura uma das max_em_voo vagas e gasta uma ficha antes de liberar a requisição."""
+        with self._em_voo:
+            self._pegar_ficha()
+            yield
+
+    def sucesso(self):
+        with self._lock:
+            self.taxa = min(self.taxa_max, self.taxa + AUMENTO_TAXA)
+
+    def falha(self, pausa: float = None):
+        with self._lock:
+            agora = time.monotonic()
+            if agora - self._ultimo_corte >= JANELA_CORTE:
+                self.taxa = max(self.taxa_min, self.taxa / 2)
+                self._ultimo_corte = agora
+            if pausa:
+                self._pausa_ate = max(self._pausa_ate, agora + pausa)
+
+
+def criar_sessao(headers: dict = None, max_paralelo: int = MAX_PARALELO) -> requests.Session:
+    """Session com conexões reaproveitadas (keep-alive) para max_paralelo threads."""
+    sessao = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_paralelo)
+    sessao.mount("https://", adapter)
+    sessao.mount("http://", adapter)
+    if headers:
+        sessao.headers.update(headers)
+    return sessao
+
+
+def _retry_after(resposta):
+    # 429/503 com Retry-After em segundos: respeita o servidor
+    try:
+        return float(resposta.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _espera(tentativa: int, backoff: float, resposta=None) -> float:
+    pedido = _retry_after(resposta) if resposta is not None else None
+    if pedido is not None:
+        return pedido
+    return backoff * 2 ** tentativa * random.uniform(0.5, 1.0)
+
+
+def requisitar(sessao: requests.Session, metodo: str, url: str, timeout=TIMEOUT_HTTP,
+               tentativas: int = TENTATIVAS_HTTP, backoff: float = BACKOFF_HTTP,
+               limitador: LimitadorTaxa = None, **kwargs) -> requests.Response:
+    """
+    sessao.request com timeout e novas tentativas. Esgotadas as tentativas,
+    devolve a última resposta (quem chama decide o que fazer com o status)
+    ou relança a última falha de rede.
+    limitador: cada tentativa passa por ele e informa se o servidor respondeu bem.
+    """
+    for tentativa in range(tentativas):
+        ultima = tentativa == tentativas - 1
+        try:
+            if limitador is None:
+                resposta = sessao.request(metodo, url, timeout=timeout, **kwargs)
+            else:
+                with limitador.vaga():
+                    resposta = sessao.request(metodo, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if limitador is not None:
+                limitador.falha()
+            if ultima:
+                raise
+            espera = _espera(tentativa, backoff)
+            motivo = type(e).__name__
+        else:
+            if resposta.status_code not in STATUS_REPETIR:
+                if limitador is not None:
+                    limitador.sucesso()
+                return resposta
+            if limitador is not None:
+                limitador.falha(_retry_after(resposta))
+            if ultima:
+                return resposta
+            espera = _espera(tentativa, backoff, resposta)
+            motivo = f"HTTP {resposta.status_code}"
+        print(f"[INFO] {metodo} {url}: {motivo}, nova tentativa em {espera:.1f}s")
+        time.sleep(espera)
+
+
+def em_paralelo(func, itens: list, max_paralelo: int = MAX_PARALELO, excecoes: bool = False) -> list:
+    """
+    [func(item) for item in itens] com até max_paralelo threads, na ordem de itens.
+    excecoes=True: a exceção de um item volta no lugar do resultado (os outros seguem).
+    """
+    def chamar(item):
+        try:
+            return func(item)
+        except Exception as e:
+            if not excecoes:
+                raise
+            return e
+
+    with ThreadPoolExecutor(max_workers=max_paralelo, thread_name_prefix="http") as executor:
+        futuros = [executor.submit(chamar, item) for item in itens]
+        return [f.result() for f in futuros]
+
+
+def requisitar_todas(sessao: requests.Session, pedidos: list, max_paralelo: int = MAX_PARALELO,
+                     excecoes: bool = False, **kwargs) -> list:
+    """
+    pedidos: [{"metodo", "url", ...kwargs do requests}] -> respostas na mesma ordem.
+    kwargs: timeout/tentativas/backoff/limitador para todas.
+    """
+    return em_paralelo(lambda pedido: requisitar(sessao, **pedido, **kwargs), pedidos, max_paralelo, excecoes)
@@ -0,0 +1,462 @@
+import numpy as np
+import pandas as pd
+from snapshot_tabelas import codificar_valor, decodificar_valor
+
+
+# -----------------------
+# Normalizadores das chaves (mesmas regras do filtro por string)
+# -----------------------
+def chave_upper_strip(categorias: pd.Series) -> pd.Series:
+    return categorias.astype(str).str.upper().str.strip()
+
+
+def chave_upper(categorias: pd.Series) -> pd.Series:
+    return categorias.astype(str).str.upper()
+
+
+def chave_identidade(categorias: pd.Series) -> pd.Series:
+    return categorias
+
+
+# -----------------------
+# Índice de substrings das chaves (filtro "contém" sem varrer as chaves)
+# -----------------------
+# substring -> códigos das chaves que a contêm. As colunas filtradas por
+# "contém" (região, porte) têm poucas dezenas de valores distintos, então
+# todas as substrings cabem com folga; acima do limite fica a varredura.
+MAX_SUBSTRINGS = 200_000
+_REGEX_ESPECIAIS = set(".^$*+?{}[]\\|()")
+_SEM_CODIGOS = np.zeros(0, dtype=np.int64)
+
+
+def montar_indice_substrings(chaves: np.ndarray, limite: int = MAX_SUBSTRINGS):
+    """-> {substring: códigos (int64, crescentes)} ou None se passar do limite"""
+    textos = [(c, k) for c, k in enumerate(chaves) if isinstance(k, str)]
+    if sum(len(k) * (len(k) + 1) // 2 for _, k in textos) > limite:
+        return None
+
+    mapa = {}
+    for c, k in textos:
+        for i in range(len(k)):
+            for j in range(i + 1, len(k) + 1):
+                mapa.setdefault(k[i:j], set()).add(c)
+    return {sub: np.array(sorted(cs), dtype=np.int64) for sub, cs in mapa.items()}
+
+
+# -----------------------
+# Índice categórico (bitmaps por valor distinto)
+# -----------------------
+class IndicePlanos:
+    """
+    Montado uma vez por carga da tabela preparada.
+
+    Cada coluna-chave vira:
+      - codigos:    int32 por linha (pd.factorize, NaN vira categoria própria)
+      - categorias: valores crus distintos
+      - chaves:     categorias normalizadas (usadas nos filtros)
+      - bitmaps:    um bitmap compactado (np.packbits) por categoria, só nas
+                    colunas de `filtros` (as outras ficam só com os códigos:
+                    bitmap por categoria custa n_categorias × n_linhas / 8 bytes)
+
+    Um filtro vira OR dos bitmaps das categorias que casam + AND entre filtros,
+    em vez de varrer a coluna inteira de strings a cada cotação.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        colunas: dict,
+        normalizadores: dict = None,
+        chaves_combo: list = None,
+        colunas_brutas: dict = None,
+        col_valor: str = "_VALOR_NUM",
+        filtros: list = None,
+    ):
+        normalizadores = normalizadores or {}
+
+        self.n = len(df)
+        self.nbytes = (self.n + 7) // 8
+        self.colunas = dict(colunas)
+        # colunas com bitmaps (padrão: todas)
+        self.filtros = list(self.colunas if filtros is None else filtros)
+        self.codigos = {}
+        self.categorias = {}
+        self.chaves = {}
+        self.bitmaps = {}
+
+        for nome, col in self.colunas.items():
+            codigos, categorias = pd.factorize(df[col], use_na_sentinel=False)
+            codigos = codigos.astype(np.int32)
+            categorias = pd.Series(np.asarray(categorias, dtype=object))
+
+            normalizar = normalizadores.get(nome, chave_identidade)
+
+            self.codigos[nome] = codigos
+            self.categorias[nome] = categorias.to_numpy()
+            self.chaves[nome] = normalizar(categorias).to_numpy()
+            if nome in self.filtros:
+                self.bitmaps[nome] = self._montar_bitmaps(codigos, len(categorias))
+
+        # índices de substrings, montados no 1º filtro "contém" de cada coluna
+        self._substrings = {}
+
+        # vidas / valor: numérico uma vez só
+        self.vidas_min = pd.to_numeric(df["_VIDAS_MIN"], errors="coerce").to_numpy(dtype=float)
+        self.vidas_max = pd.to_numeric(df["_VIDAS_MAX"], errors="coerce").to_numpy(dtype=float)
+        self.valores = pd.to_numeric(df[col_valor], errors="coerce").to_numpy(dtype=float)
+
+        # combo de cada linha, numerado na ordem do groupby(sort=True) das chaves
+        # -> mesmo desempate que o groupby dava, sem precisar do DF na cotação
+        self.chaves_combo = list(chaves_combo or [])
+        self.combo = np.zeros(self.n, dtype=np.int32)
+        self.combos = np.zeros((0, len(self.chaves_combo)), dtype=np.int32)
+        if self.chaves_combo and self.n:
+            cols = [self.colunas[k] for k in self.chaves_combo]
+            self.combo = df.groupby(cols, dropna=False).ngroup().to_numpy().astype(np.int32)
+            _, rep = np.unique(self.combo, return_index=True)
+            self.combos = np.stack([self.codigos[k][rep] for k in self.chaves_combo], axis=1)
+
+        # colunas devolvidas cruas nos detalhes (numérica direto; texto/misto por código)
+        self.brutas = {}
+        for nome, col in (colunas_brutas or {}).items():
+            serie = df[col]
+            if (
+                isinstance(serie.dtype, np.dtype)
+                and pd.api.types.is_numeric_dtype(serie)
+                and not pd.api.types.is_bool_dtype(serie)
+            ):
+                self.brutas[nome] = (serie.to_numpy(), None)
+            else:
+                codigos, categorias = pd.factorize(serie, use_na_sentinel=False)
+                self.brutas[nome] = (codigos.astype(np.int32), np.asarray(categorias, dtype=object))
+
+    def _montar_bitmaps(self, codigos: np.ndarray, n_cat: int) -> np.ndarray:
+        bitmaps = np.zeros((n_cat, self.nbytes), dtype=np.uint8)
+        if self.n == 0:
+            return bitmaps
+        # agrupa as linhas por código uma vez, e marca cada categoria no seu bitmap
+        ordem = np.argsort(codigos, kind="stable")
+        limites = np.searchsorted(codigos[ordem], np.arange(n_cat + 1))
+        linha = np.zeros(self.n, dtype=bool)
+        for k in range(n_cat):
+            ids = ordem[limites[k]:limites[k + 1]]
+            linha[ids] = True
+            bitmaps[k] = np.packbits(linha)
+            linha[ids] = False
+        return bitmaps
+
+    # -----------------------
+    # Bitmaps
+    # -----------------------
+    def tudo(self) -> np.ndarray:
+        return np.packbits(np.ones(self.n, dtype=bool))
+
+    def bitmap_codigos(self, nome: str, codigos) -> np.ndarray:
+        codigos = np.asarray(codigos, dtype=np.int64)
+        if codigos.size == 0:
+            return np.zeros(self.nbytes, dtype=np.uint8)
+        bitmaps = self.bitmaps.get(nome)
+        if bitmaps is None:
+            # coluna sem bitmaps: uma passada nos códigos
+            return np.packbits(np.isin(self.codigos[nome], codigos))
+        return np.bitwise_or.reduce(bitmaps[codigos], axis=0)
+
+    def codigos_iguais(self, nome: str, valores) -> np.ndarray:
+        return np.flatnonzero(pd.Series(self.chaves[nome]).isin(list(valores)).to_numpy())
+
+    def _indice_substrings(self, nome: str):
+        sub = self._substrings.get(nome)
+        if sub is None:
+            sub = montar_indice_substrings(self.chaves[nome])
+            self._substrings[nome] = False if sub is None else sub
+        return sub or None
+
+    def codigos_contem(self, nome: str, padrao: str, regex: bool = True) -> np.ndarray:
+        # termo literal (não vazio): consulta no índice de substrings
+        if padrao and not (regex and _REGEX_ESPECIAIS & set(padrao)):
+            sub = self._indice_substrings(nome)
+            if sub is not None:
+                return sub.get(padrao, _SEM_CODIGOS)
+
+        chaves = pd.Series(self.chaves[nome], dtype=object)
+        return np.flatnonzero(chaves.str.contains(padrao, regex=regex, na=False).to_numpy(dtype=bool))
+
+    def bitmap_iguais(self, nome: str, valores) -> np.ndarray:
+        return self.bitmap_codigos(nome, self.codigos_iguais(nome, valores))
+
+    def bitmap_contem(self, nome: str, padrao: str, regex: bool = True) -> np.ndarray:
+        return self.bitmap_codigos(nome, self.codigos_contem(nome, padrao, regex=regex))
+
+    def bitmap_vidas(self, vmin_q: int, vmax_q: int) -> np.ndarray:
+        return np.packbits((self.vidas_max >= vmin_q) & (self.vidas_min <= vmax_q))
+
+    def mascara(self, bits: np.ndarray) -> np.ndarray:
+        return np.unpackbits(bits, count=self.n).astype(bool)
+
+    def contar(self, bits: np.ndarray) -> int:
+        # o preenchimento do último byte é sempre 0 (packbits), então dá para contar por byte
+        if hasattr(np, "bitwise_count"):
+            return int(np.bitwise_count(bits).sum(dtype=np.int64))
+        return int(np.unpackbits(bits, count=self.n).sum())
+
+    # -----------------------
+    # Combos / valores crus
+    # -----------------------
+    def bruto(self, nome: str, linhas) -> np.ndarray:
+        """Valores crus da coluna `nome` nas linhas pedidas (mesmo shape de linhas)."""
+        valores, categorias = self.brutas[nome]
+        if categorias is None:
+            return valores[linhas]
+        return categorias[valores[linhas]]
+
+    def tabela_combos(self, ids) -> pd.DataFrame:
+        """Valores das chaves (colunas do DF) de cada combo em ids."""
+        ids = np.asarray(ids, dtype=np.int64)
+        return pd.DataFrame({
+            self.colunas[k]: self.categorias[k][self.combos[ids, j]]
+            for j, k in enumerate(self.chaves_combo)
+        })
+
+    def agregar_combos(self, mascara: np.ndarray, nome_faixa: str = "faixa"):
+        """
+        groupby(chaves_combo).agg(nunique da faixa, sum do valor) das linhas
+        marcadas com preço válido, direto nos arrays.
+
+        -> (ids, faixas_distintas, soma, linhas, grupo)
+           ids:    combos presentes, em ordem crescente (= ordem das chaves)
+           linhas: linhas usadas, na ordem da planilha
+           grupo:  posição em ids do combo de cada linha
+        """
+        linhas = np.flatnonzero(mascara & ~np.isnan(self.valores))
+        ids, grupo = np.unique(self.combo[linhas], return_inverse=True)
+        grupo = grupo.reshape(-1)
+        n_grupos = len(ids)
+
+        n_fx = len(self.categorias[nome_faixa])
+        pares = np.unique(grupo.astype(np.int64) * n_fx + self.codigos[nome_faixa][linhas])
+        faixas_distintas = np.bincount(pares // n_fx, minlength=n_grupos)
+
+        # soma compensada (Kahan) na ordem da planilha, como o groupby.sum do pandas
+        # -> mesmos totais bit a bit; uma passada por posição dentro do grupo
+        ordem = np.argsort(grupo, kind="stable")
+        valores = self.valores[linhas][ordem]
+        tamanhos = np.bincount(grupo, minlength=n_grupos)
+        inicio = np.concatenate(([0], np.cumsum(tamanhos)[:-1])) if n_grupos else tamanhos
+        soma = np.zeros(n_grupos)
+        comp = np.zeros(n_grupos)
+        for p in range(int(tamanhos.max()) if n_grupos else 0):
+            g = np.flatnonzero(tamanhos > p)
+            y = valores[inicio[g] + p] - comp[g]
+            t = soma[g] + y
+            c = (t - soma[g]) - y
+            c[np.isnan(c)] = 0.0
+            comp[g] = c
+            soma[g] = t
+
+        return ids, faixas_distintas, soma, linhas, grupo
+
+    # -----------------------
+    # Exportação (store em arquivo, ver store_precos.py)
+    # -----------------------
+    def exportar(self):
+        """-> (arrays, meta): arrays NumPy + descrição JSON para reconstruir o índice."""
+        arrays = {
+            "vidas_min": self.vidas_min,
+            "vidas_max": self.vidas_max,
+            "valores": self.valores,
+            "combo": self.combo,
+            "combos": self.combos,
+        }
+        meta = {
+            "n": self.n,
+            "colunas": self.colunas,
+            "chaves_combo": self.chaves_combo,
+            "filtros": self.filtros,
+            "categorias": {},
+            "chaves": {},
+            "brutas": {},
+        }
+        for nome in self.colunas:
+            arrays[f"codigos/{nome}"] = self.codigos[nome]
+            if nome in self.bitmaps:
+                arrays[f"bitmaps/{nome}"] = self.bitmaps[nome]
+            meta["categorias"][nome] = [codificar_valor(v) for v in self.categorias[nome]]
+            meta["chaves"][nome] = [codificar_valor(v) for v in self.chaves[nome]]
+        for nome, (valores, categorias) in self.brutas.items():
+            arrays[f"brutas/{nome}"] = valores
+            meta["brutas"][nome] = None if categorias is None else [codificar_valor(v) for v in categorias]
+        return arrays, meta
+
+    @classmethod
+    def importar(cls, arrays: dict, meta: dict) -> "IndicePlanos":
+        """Inverso do exportar(); os arrays são usados como vieram (ex.: views de mmap)."""
+        def objetos(lista):
+            out = np.empty(len(lista), dtype=object)
+            for i, (tipo, texto) in enumerate(lista):
+                out[i] = decodificar_valor(tipo, texto)
+            return out
+
+        self = cls.__new__(cls)
+        self.n = meta["n"]
+        self.nbytes = (self.n + 7) // 8
+        self.colunas = dict(meta["colunas"])
+        self.chaves_combo = list(meta["chaves_combo"])
+        # stores antigos não têm "filtros": lá toda coluna tinha bitmaps
+        self.filtros = list(meta.get("filtros", self.colunas))
+        self.codigos = {nome: arrays[f"codigos/{nome}"] for nome in self.colunas}
+        self.bitmaps = {nome: arrays[f"bitmaps/{nome}"] for nome in self.filtros}
+        self.categorias = {nome: objetos(meta["categorias"][nome]) for nome in self.colunas}
+        self.chaves = {nome: objetos(meta["chaves"][nome]) for nome in self.colunas}
+        self._substrings = {}
+        self.vidas_min = arrays["vidas_min"]
+        self.vidas_max = arrays["vidas_max"]
+        self.valores = arrays["valores"]
+        self.combo = arrays["combo"]
+        self.combos = arrays["combos"]
+        self.brutas = {
+            nome: (arrays[f"brutas/{nome}"], None if cats is None else objetos(cats))
+            for nome, cats in meta["brutas"].items()
+        }
+        return self
+
+
+# -----------------------
+# Matriz densa combo × faixa (totais ponderados por vidas)
+# -----------------------
+class MatrizPrecos:
+    """
+    Montada uma vez por carga, a partir do IndicePlanos (só linhas de preço válido).
+
+    Linha da matriz = combo (chaves) + recorte de vidas (o recorte não é chave
+    do combo, mas decide quais linhas passam no filtro de vidas).
+    Coluna = faixa normalizada (coluna "faixa" do índice).
+
+      - precos: valor da 1ª linha da planilha de cada (linha, faixa); NaN se não cobre
+      - linhas: posição dessa linha no DF (-1 se não cobre), p/ montar os detalhes
+      - combo_da_unidade: combo do índice (ordem do groupby(sort=True)) de cada linha
+    """
+
+    def __init__(self, indice: IndicePlanos, nome_faixa: str = "faixa"):
+        self.valores = indice.valores
+        validas = np.flatnonzero(~np.isnan(self.valores))
+
+        combo = indice.combo[validas].astype(np.int64)
+        vidas = pd.DataFrame({
+            "min": indice.vidas_min[validas],
+            "max": indice.vidas_max[validas],
+        }).groupby(["min", "max"], dropna=False).ngroup().to_numpy().astype(np.int64)
+        n_vidas = int(vidas.max()) + 1 if len(vidas) else 1
+
+        unidade, chaves_unidade = pd.factorize(combo * n_vidas + vidas)
+        faixa_cod, faixas = pd.factorize(indice.codigos[nome_faixa][validas])
+        n_unid, n_fx = len(chaves_unidade), len(faixas)
+
+        # validas é crescente: 1ª ocorrência de cada (unidade, faixa) = 1ª linha da planilha
+        chave = unidade.astype(np.int64) * n_fx + faixa_cod
+        unicas, primeira = np.unique(chave, return_index=True)
+        linhas = np.full(n_unid * n_fx, -1, dtype=np.int64)
+        linhas[unicas] = validas[primeira]
+
+        self.linhas = linhas.reshape(n_unid, n_fx)
+        self.precos = np.where(self.linhas >= 0, self.valores[self.linhas], np.nan)
+        self.faixas = list(indice.categorias[nome_faixa][faixas])
+        self.coluna_faixa = {f: j for j, f in enumerate(self.faixas)}
+
+        _, rep = np.unique(unidade, return_index=True)
+        self.linha_rep = validas[rep]
+        self.combo_da_unidade = np.asarray(chaves_unidade, dtype=np.int64) // n_vidas
+
+    def exportar(self):
+        """-> (arrays, meta), como no IndicePlanos (valores ficam no índice)."""
+        arrays = {
+            "linhas": self.linhas,
+            "precos": self.precos,
+            "linha_rep": self.linha_rep,
+            "combo_da_unidade": self.combo_da_unidade,
+        }
+        return arrays, {"faixas": [codificar_valor(f) for f in self.faixas]}
+
+    @classmethod
+    def importar(cls, arrays: dict, meta: dict, indice: IndicePlanos) -> "MatrizPrecos":
+        self = cls.__new__(cls)
+        self.valores = indice.valores
+        self.linhas = arrays["linhas"]
+        self.precos = arrays["precos"]
+        self.linha_rep = arrays["linha_rep"]
+        self.combo_da_unidade = arrays["combo_da_unidade"]
+        self.faixas = [decodificar_valor(tipo, texto) for tipo, texto in meta["faixas"]]
+        self.coluna_faixa = {f: j for j, f in enumerate(self.faixas)}
+        return self
+
+    def totais(self, mascara_linhas: np.ndarray, contagem: dict):
+        """
+        mascara_linhas: linhas que passaram nos filtros (região/porte/vidas)
+        contagem:       {faixa normalizada: qtd de vidas}
+
+        -> (ids_combos, soma, linhas_por_faixa) só dos combos que cobrem todas
+           as faixas, em ordem crescente de combo (ids do IndicePlanos). linhas_por_faixa[i, j] é a
+           linha do DF usada para a j-ésima faixa de `contagem`.
+        """
+        vazio = (np.empty(0, dtype=np.int64), np.empty(0), np.empty((0, len(contagem)), dtype=np.int64))
+
+        cols = [self.coluna_faixa.get(f, -1) for f in contagem]
+        if not cols or min(cols) < 0:
+            return vazio
+
+        unid = np.flatnonzero(mascara_linhas[self.linha_rep])
+        if unid.size == 0:
+            return vazio
+
+        unid = unid[np.argsort(self.combo_da_unidade[unid], kind="stable")]
+        combo_ord = self.combo_da_unidade[unid]
+        inicio = np.flatnonzero(np.r_[True, combo_ord[1:] != combo_ord[:-1]])
+        ids = combo_ord[inicio]
+
+        if inicio.size == unid.size:
+            # caso comum: 1 recorte de vidas por combo -> matriz direto
+            precos = self.precos[unid][:, cols]
+            linhas = self.linhas[unid][:, cols]
+        else:
+            # recortes de vidas sobrepostos: vale a 1ª linha da planilha entre eles
+            sem = np.iinfo(np.int64).max
+            linhas = self.linhas[unid][:, cols]
+            linhas = np.minimum.reduceat(np.where(linhas < 0, sem, linhas), inicio, axis=0)
+            linhas[linhas == sem] = -1
+            precos = np.where(linhas >= 0, self.valores[linhas], np.nan)
+
+        cobre = ~np.isnan(precos).any(axis=1)
+        ids, precos, linhas = ids[cobre], precos[cobre], linhas[cobre]
+
+        # produto matriz × vetor de vidas, acumulado coluna a coluna na ordem do payload
+        # (mesma ordem de soma do cálculo por grupo -> mesmos totais, bit a bit)
+        soma = np.zeros(len(ids))
+        for j, qtd in enumerate(contagem.values()):
+            soma += precos[:, j] * qtd
+
+        return ids, soma, linhas
+
+
+# -----------------------
+# Ranking parcial (top-k)
+# -----------------------
+def ordem_top_k(chaves: tuple, k: int = None) -> np.ndarray:
+    """
+    Mesmo resultado de np.lexsort(chaves)[:k] (última chave = primária,
+    empate -> posição original, como o sort_values por várias colunas),
+    mas só ordena os candidatos que podem cair no top-k (np.partition na primária).
+    """
+    primaria = np.asarray(chaves[-1])
+    n = len(primaria)
+    if k is None or k >= n:
+        return np.lexsort(chaves)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    limiar = np.partition(primaria, k - 1)[k - 1]
+    if np.isnan(limiar):
+        return np.lexsort(chaves)[:k]
+
+    # todos os empates no limiar entram: o desempate pelas outras chaves decide
+    candidatos = np.flatnonzero(primaria <= limiar)
+    ordem = np.lexsort(tuple(np.asarray(c)[candidatos] for c in chaves))
+    return candidatos[ordem[:k]]
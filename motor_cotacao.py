@@ -0,0 +1,928 @@
+import os
+import re
+import time
+import threading
+import itertools
+from collections import Counter, OrderedDict
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from sftp_utils import carregar_planos_de_sftp
+from snapshot_tabelas import ler_snapshot, salvar_snapshot
+from indice_planos import IndicePlanos, MatrizPrecos, chave_upper, chave_upper_strip, ordem_top_k
+from store_precos import abrir_store, salvar_store
+from trace_cotacao import TraceCotacao, TRACE_NULO
+
+# -----------------------
+# Motor único de cotação de planos
+# -----------------------
+# Cada operadora é só configuração (Operadora):
+#   - esquema: nome lógico -> coluna da planilha dela
+#   - regra de margem: orçamento -> teto (ou catálogo sem orçamento)
+#   - regra de total:  como somar/detalhar um combo (linhas x vidas por faixa)
+#   - filtro de região
+# Preparo, índice, filtros, ranking e paginação são os mesmos para todas.
+
+# colunas lógicas que toda planilha de planos precisa ter
+COLUNAS_ESQUEMA = ["plano", "regiao", "acomodacao", "porte", "faixa", "preco", "vidas", "copart"]
+
+# chaves do combo (nomes lógicos do índice, na ordem do groupby)
+CHAVES_COMBO_INDICE = ["plano", "regiao", "acomodacao", "porte", "copart"]
+
+# colunas do índice usadas como filtro (só elas ganham bitmaps)
+FILTROS_INDICE = ["regiao", "porte", "faixa"]
+
+# mesma normalização que os filtros por string aplicavam linha a linha
+NORMALIZADORES_INDICE = {
+    "regiao": chave_upper_strip,
+    "porte": chave_upper,
+}
+
+# cache de resultados por operadora (ver CacheCotacoes)
+CACHE_MAX_ITENS = 1024
+CACHE_TTL = 300.0  # segundos
+
+# iterar(): detalhes montados em lotes que dobram a partir deste tamanho
+LOTE_DETALHES = 16
+
+
+# -----------------------
+# Helpers de parsing
+# -----------------------
+def parse_money_brl(s: str):
+    if s is None:
+        return None
+    s = str(s).strip()
+    if not s:
+        return None
+
+    s = s.replace("R$", "").strip()
+
+    # 1.234,56 -> 1234.56
+    if "," in s and "." in s:
+        s = s.replace(".", "").replace(",", ".")
+    # 700,00 -> 700.00
+    elif "," in s and "." not in s:
+        s = s.replace(",", ".")
+
+    m = re.search(r"\d+(\.\d+)?", s)
+    if not m:
+        return None
+
+    try:
+        return float(m.group(0))
+    except:
+        return None
+
+
+def faixa_preco(valor_estimado: float, margem: float = 100.0):
+    if valor_estimado is None:
+        return (None, None)
+    return (valor_estimado - margem, valor_estimado + margem)
+
+
+def parse_range_numbers(s: str):
+    if not s:
+        return (None, None)
+    nums = list(map(int, re.findall(r"\d+", str(s))))
+    if len(nums) == 0:
+        return (None, None)
+    if len(nums) == 1:
+        return (nums[0], nums[0])
+    return (min(nums[0], nums[1]), max(nums[0], nums[1]))
+
+
+def normalize_faixa(s: str):
+    if s is None or (isinstance(s, float) and np.isnan(s)):
+        return ""
+    return str(s).replace(" ", "").strip()
+
+
+def parse_vidas_df(s: str):
+    if not s or (isinstance(s, float) and np.isnan(s)):
+        return (None, None)
+    nums = list(map(int, re.findall(r"\d+", str(s))))
+    if len(nums) == 0:
+        return (None, None)
+    if len(nums) == 1:
+        return (nums[0], nums[0])
+    return (min(nums[0], nums[1]), max(nums[0], nums[1]))
+
+
+def filtrar_regiao_series(series: pd.Series, regiao_payload: str) -> pd.Series:
+    s = series.astype(str).str.upper().str.strip()
+    rp = (regiao_payload or "").upper().strip()
+
+    if not rp:
+        return pd.Series([True] * len(series), index=series.index)
+
+    if rp == "SP":
+        return (s == "SP")
+    else:
+        return s.str.contains(rp, na=False)
+
+
+def filtrar_regiao_indice(indice: IndicePlanos, regiao_payload: str) -> np.ndarray:
+    """
+    Mesma regra do filtrar_regiao_series, sobre as chaves de região do índice
+    (já normalizadas na carga): "SP" exato, o resto por substring via índice
+    de substrings -> códigos de região -> bitmap.
+    """
+    rp = (regiao_payload or "").upper().strip()
+
+    if not rp:
+        return indice.tudo()
+
+    if rp == "SP":
+        return indice.bitmap_iguais("regiao", [rp])
+    else:
+        return indice.bitmap_contem("regiao", rp)
+
+
+# -----------------------
+# Helpers vetorizados (preparo da tabela)
+# -----------------------
+def _por_valor_unico(series: pd.Series, func) -> np.ndarray:
+    # as colunas se repetem muito: roda func uma vez por valor distinto e espalha pelas linhas
+    codigos, unicos = pd.factorize(series, use_na_sentinel=False)
+    valores = np.empty(len(unicos), dtype=object)
+    for i, u in enumerate(unicos):
+        valores[i] = func(u)
+    return valores[codigos]
+
+
+def _coluna_inteira(valores: np.ndarray, index) -> pd.Series:
+    # sem faltantes -> int (igual ao dtype que o apply inferia)
+    col = pd.Series(valores, index=index, dtype=float)
+    if len(col) and not col.isna().any():
+        col = col.astype(np.int64)
+    return col
+
+
+def normalize_faixa_series(series: pd.Series) -> pd.Series:
+    return pd.Series(_por_valor_unico(series, normalize_faixa), index=series.index, dtype=object)
+
+
+def parse_vidas_series(series: pd.Series):
+    """
+    parse_vidas_df em bloco.
+    -> (serie_vidas_min, serie_vidas_max)
+    """
+    minmax = _por_valor_unico(series, parse_vidas_df)
+    vmin = np.array([np.nan if x[0] is None else x[0] for x in minmax], dtype=float)
+    vmax = np.array([np.nan if x[1] is None else x[1] for x in minmax], dtype=float)
+    return _coluna_inteira(vmin, series.index), _coluna_inteira(vmax, series.index)
+
+
+def parse_money_brl_series(series: pd.Series) -> pd.Series:
+    """
+    parse_money_brl em bloco (None/texto inválido -> NaN).
+      - coluna numérica: o regex sobre str(v) extrai |v|, então vai direto no NumPy
+      - texto: mesmas trocas de "," / "." e mesmo regex, via .str sobre os valores distintos
+    """
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        v = series.to_numpy(dtype=float, na_value=np.nan)
+        a = np.abs(v)
+        out = np.where(np.isnan(v), np.nan, a)
+
+        # str(v) sai em notação científica (ou inf) fora dessa faixa -> linha a linha
+        simples = np.isnan(v) | (a == 0) | ((a >= 1e-4) & (a < 1e16))
+        for i in np.flatnonzero(~simples):
+            r = parse_money_brl(v[i])
+            out[i] = np.nan if r is None else r
+        return pd.Series(out, index=series.index)
+
+    codigos, unicos = pd.factorize(series, use_na_sentinel=False)
+    u = pd.Series(np.asarray(unicos, dtype=object), dtype=object)
+    nulo = u.isna().to_numpy()
+
+    s = u.astype(str).str.strip().str.replace("R$", "", regex=False).str.strip()
+    tem_virgula = s.str.contains(",", regex=False)
+    tem_ponto = s.str.contains(".", regex=False)
+
+    # 1.234,56 -> 1234.56
+    s = s.mask(tem_virgula & tem_ponto, s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    # 700,00 -> 700.00
+    s = s.mask(tem_virgula & ~tem_ponto, s.str.replace(",", ".", regex=False))
+
+    # float() em cada string extraída (o to_numeric do pandas erra 1 ULP às vezes)
+    num = s.str.extract(r"(\d+(?:\.\d+)?)", expand=False)
+    achou = num.notna().to_numpy() & ~nulo
+    valores = np.full(len(u), np.nan)
+    valores[achou] = num.to_numpy(dtype=object)[achou].astype(float)
+    return pd.Series(valores[codigos], index=series.index)
+
+
+# -----------------------
+# Regras de margem (orçamento -> teto)
+# -----------------------
+class MargemFixa:
+    """teto = orçamento + margem. Sem orçamento válido não há cotação."""
+
+    catalogo = False
+
+    def __init__(self, margem: float = 100.0):
+        self.margem = float(margem)
+
+    def aplicar(self, budget):
+        """-> (budget, teto); teto None = sem filtro de preço"""
+        if budget is None:
+            return None, None
+        return budget, budget + self.margem
+
+
+class MargemPercentual:
+    """
+    teto = orçamento + max(mínimo, percentual do orçamento).
+    Sem orçamento (ou <= 0) vira catálogo: traz tudo, mais barato primeiro.
+    """
+
+    catalogo = True
+
+    def __init__(self, percentual: float = 0.10, minimo: float = 100.0):
+        self.percentual = percentual
+        self.minimo = minimo
+
+    def aplicar(self, budget):
+        if budget is None or budget <= 0:
+            return None, None
+        if budget * self.percentual < self.minimo:
+            return budget, budget + self.minimo
+        return budget, budget * (1 + self.percentual)
+
+
+# -----------------------
+# Regras de total do combo
+# -----------------------
+class TotalSomaLinhas:
+    """
+    Total = soma de todas as linhas do combo nas faixas pedidas (faixa repetida
+    no payload conta uma vez); o combo precisa ter todas as faixas.
+    Detalhe = linhas do combo, da mais barata para a mais cara.
+    Empate no ranking -> maior soma primeiro.
+    """
+
+    usa_matriz = False
+    desempate = -1
+
+    def faixas(self, faixas_payload: list):
+        return list(dict.fromkeys(faixas_payload))
+
+    def chave_faixas(self, faixas) -> tuple:
+        # só o conjunto importa para o resultado
+        return tuple(sorted(faixas))
+
+    def combos(self, tabela, bits, faixas, cnt, debug):
+        """-> (agg com chaves/soma_valor/_COMBO, contexto p/ detalhes) ou None"""
+        indice = tabela.indice
+
+        bits = bits & indice.bitmap_iguais("faixa", faixas)
+        cnt(bits, f"APÓS FAIXAS ({faixas})", "filtro_faixas")
+
+        mask = indice.mascara(bits)
+        if not mask.any():
+            if debug:
+                print("[DEBUG] base vazio. Verifique regiao/porte/faixas/vidas.")
+            return None
+
+        # groupby(chaves).agg(nunique faixa, sum valor) direto nos arrays do índice
+        ids, faixas_distintas, somas, linhas, grupo = indice.agregar_combos(mask)
+        if linhas.size == 0:
+            if debug: print("[DEBUG] base vazio após dropna _VALOR_NUM.")
+            return None
+
+        agg = indice.tabela_combos(ids)
+        agg["faixas_distintas"] = faixas_distintas
+        agg["soma_valor"] = somas
+        # _COMBO i == grupo i das linhas (mesma ordenação das chaves)
+        agg["_COMBO"] = np.arange(len(agg))
+
+        agg = agg[agg["faixas_distintas"] == len(set(faixas))]
+        return agg, (linhas, grupo)
+
+    def detalhes(self, tabela, contexto, agg_pagina: pd.DataFrame) -> list:
+        indice = tabela.indice
+        linhas, grupo = contexto
+
+        # ordena só as linhas dos combos da página, por (grupo, valor), e fatia cada combo
+        grupos_sel = agg_pagina["_COMBO"].to_numpy()
+        usadas = np.isin(grupo, grupos_sel)
+        linhas_sel, grupo_sel = linhas[usadas], grupo[usadas]
+
+        ordem = np.lexsort((indice.valores[linhas_sel], grupo_sel))
+        grupo_ord = grupo_sel[ordem]
+        linhas_ord = linhas_sel[ordem]
+        faixas_ord = indice.bruto("faixa_etaria", linhas_ord).tolist()
+        valores_ord = indice.bruto("valor", linhas_ord).tolist()
+
+        inicios = np.searchsorted(grupo_ord, grupos_sel, side="left").tolist()
+        fins = np.searchsorted(grupo_ord, grupos_sel, side="right").tolist()
+
+        return [
+            [
+                {
+                    "faixa_etaria": faixa,
+                    "valor": valor,
+                }
+                for faixa, valor in zip(faixas_ord[ini:fim], valores_ord[ini:fim])
+            ]
+            for ini, fim in zip(inicios, fins)
+        ]
+
+
+class TotalPonderadoVidas:
+    """
+    Total = preço de cada faixa × vidas nessa faixa (faixa repetida no payload
+    = mais uma vida), via MatrizPrecos; o combo precisa cobrir todas as faixas.
+    Detalhe = uma linha por faixa, do menor para o maior valor total.
+    Empate no ranking -> menor soma primeiro.
+    """
+
+    usa_matriz = True
+    desempate = 1
+
+    def faixas(self, faixas_payload: list):
+        return Counter(faixas_payload)
+
+    def chave_faixas(self, faixas) -> tuple:
+        # a ordem conta (ordem da soma e desempate dos detalhes)
+        return tuple(faixas.items())
+
+    def combos(self, tabela, bits, faixas, cnt, debug):
+        indice, matriz = tabela.indice, tabela.matriz
+
+        # faixa não entra na máscara: vira coluna da matriz
+        bits_faixa = bits & indice.bitmap_iguais("faixa", list(faixas))
+        cnt(bits_faixa, f"APÓS FAIXAS ({list(faixas.elements())})", "filtro_faixas")
+
+        mask = indice.mascara(bits)
+        mask_faixa = indice.mascara(bits_faixa)
+        if not mask_faixa.any():
+            if debug:
+                print("[DEBUG] base vazio. Verifique regiao/porte/faixas/vidas.")
+            return None
+
+        if np.isnan(matriz.valores[mask_faixa]).all():
+            if debug: print("[DEBUG] base vazio após dropna _VALOR_NUM.")
+            return None
+
+        # soma = matriz de preços (combos filtrados × faixas do payload) · vidas por faixa;
+        # combo que não cobre alguma faixa (NaN) fica de fora
+        ids, somas, linhas_fx = matriz.totais(mask, faixas)
+
+        agg = indice.tabela_combos(ids)
+        agg["soma_valor"] = somas
+        agg["_COMBO"] = np.arange(len(agg))
+        return agg, (faixas, linhas_fx)
+
+    def detalhes(self, tabela, contexto, agg_pagina: pd.DataFrame) -> list:
+        indice, matriz = tabela.indice, tabela.matriz
+        faixas, linhas_fx = contexto
+
+        # preços crus só dos combos da página
+        combos_pagina = agg_pagina["_COMBO"].to_numpy()
+        precos = indice.bruto("valor", linhas_fx[combos_pagina])
+
+        saida = []
+        for p, c in enumerate(combos_pagina.tolist()):
+            itens = []
+            for j, (faixa, qtd) in enumerate(faixas.items()):
+                i = linhas_fx[c, j]
+                itens.append({
+                    "faixa_etaria": faixa,
+                    "vidas": qtd,
+                    "valor_unitario": precos[p, j],
+                    "valor_total": float(matriz.valores[i]) * qtd
+                })
+
+            itens.sort(key=lambda x: x["valor_total"])
+            saida.append(itens)
+        return saida
+
+
+# -----------------------
+# Cache de resultados (LRU + TTL)
+# -----------------------
+def _copiar_resultado(r: dict) -> dict:
+    """Cópia de um resultado do cotar (dict + detalhes_por_faixa, ambos rasos)."""
+    return {**r, "detalhes_por_faixa": [dict(d) for d in r["detalhes_por_faixa"]]}
+
+
+class CacheCotacoes:
+    """
+    LRU limitado por quantidade e por idade das entradas. Thread-safe.
+    Os valores guardados são devolvidos como estão (não copiar/alterar os dicts).
+    """
+
+    def __init__(self, max_itens: int = CACHE_MAX_ITENS, ttl: float = CACHE_TTL):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.acertos = 0
+        self.falhas = 0
+        self._itens = OrderedDict()  # chave -> (instante, valor)
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        agora = time.monotonic()
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None or agora - item[0] > self.ttl:
+                if item is not None:
+                    del self._itens[chave]
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return item[1]
+
+    def guardar(self, chave, valor):
+        if self.max_itens <= 0:
+            return
+        with self._lock:
+            self._itens[chave] = (time.monotonic(), valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def __len__(self):
+        return len(self._itens)
+
+
+# -----------------------
+# Tabela carregada + operadora
+# -----------------------
+_SERIAL_TABELA = itertools.count(1)
+
+
+class TabelaPlanos:
+    """DF preparado (None quando veio do store) + índice + matriz (se a regra usa)."""
+
+    def __init__(self, df: pd.DataFrame, indice: IndicePlanos, matriz: MatrizPrecos = None, versao=None):
+        self.df = df
+        self.indice = indice
+        self.matriz = matriz
+        self.versao = versao
+        self.serial = next(_SERIAL_TABELA)
+
+    @property
+    def impressao(self):
+        """Identifica o conteúdo da tabela nas chaves do cache (planilha nova -> chave nova)."""
+        return self.versao if self.versao is not None else ("tabela", self.serial)
+
+
+class Operadora:
+    """
+    Esquema + regras de uma operadora. Todo o resto (preparo, índice,
+    filtros, ranking, paginação) é o mesmo motor.
+
+    colunas: nome lógico (COLUNAS_ESQUEMA) -> coluna da planilha da operadora
+    """
+
+    def __init__(
+        self,
+        nome: str,
+        colunas: dict,
+        sftp_url: str,
+        margem,
+        total,
+        filtro_regiao=filtrar_regiao_indice,
+        sheet_name: str = "Sheet1",
+        env_snapshot: str = None,
+        env_store: str = None,
+        cache_max_itens: int = CACHE_MAX_ITENS,
+        cache_ttl: float = CACHE_TTL,
+    ):
+        faltando = [c for c in COLUNAS_ESQUEMA if c not in colunas]
+        if faltando:
+            raise ValueError(f"Esquema da operadora {nome} sem as colunas: {faltando}")
+
+        self.nome = nome
+        self.colunas = dict(colunas)
+        self.sftp_url = sftp_url
+        self.sheet_name = sheet_name
+        self.margem = margem
+        self.total = total
+        self.filtro_regiao = filtro_regiao
+        self.env_snapshot = env_snapshot
+        self.env_store = env_store
+
+        # colunas codificadas no índice (nome lógico -> coluna do DF preparado)
+        self.colunas_indice = {
+            "regiao": self.colunas["regiao"],
+            "porte": self.colunas["porte"],
+            "faixa": "_FAIXA_N",
+            "plano": self.colunas["plano"],
+            "acomodacao": self.colunas["acomodacao"],
+            "copart": self.colunas["copart"],
+        }
+        # colunas devolvidas cruas nos detalhes por faixa
+        self.colunas_brutas = {
+            "faixa_etaria": self.colunas["faixa"],
+            "valor": self.colunas["preco"],
+        }
+        self.chaves = [self.colunas[k] for k in CHAVES_COMBO_INDICE]
+
+        # tabela da última carga (reaproveitada enquanto a planilha não mudar)
+        self._tabela = None
+        self._avulsa = None  # ((df, indice, matriz) recebidos, TabelaPlanos)
+        self._lock = threading.Lock()
+
+        # resultados por (tabela, payload canônico, página)
+        self.cache = CacheCotacoes(cache_max_itens, cache_ttl)
+
+    # -----------------------
+    # Preparo / carga
+    # -----------------------
+    def carregar_planilha(self, sftp_url: str = None, sheet_name: str = None, versao_atual=None,
+                          trace=TRACE_NULO) -> pd.DataFrame:
+        """versao_atual: se a planilha remota ainda estiver nela, devolve None (nada lido/copiado)."""
+        return carregar_planos_de_sftp(
+            sftp_url or self.sftp_url, sheet_name=sheet_name or self.sheet_name,
+            versao_atual=versao_atual, trace=trace,
+        )
+
+    def preparar_df(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.copy()
+        df.columns = [c.strip() for c in df.columns]
+
+        # colunas auxiliares (em bloco; mesmo resultado do apply linha a linha)
+        df["_FAIXA_N"] = normalize_faixa_series(df[self.colunas["faixa"]])
+        df["_VALOR_NUM"] = parse_money_brl_series(df[self.colunas["preco"]])
+        df["_VIDAS_MIN"], df["_VIDAS_MAX"] = parse_vidas_series(df[self.colunas["vidas"]])
+
+        return df
+
+    def montar_indice(self, df: pd.DataFrame) -> IndicePlanos:
+        return IndicePlanos(
+            df,
+            self.colunas_indice,
+            NORMALIZADORES_INDICE,
+            chaves_combo=CHAVES_COMBO_INDICE,
+            colunas_brutas=self.colunas_brutas,
+            filtros=FILTROS_INDICE,
+        )
+
+    def montar_matriz(self, indice: IndicePlanos) -> MatrizPrecos:
+        return MatrizPrecos(indice) if self.total.usa_matriz else None
+
+    def tabela(self, df: pd.DataFrame = None, indice: IndicePlanos = None, matriz: MatrizPrecos = None,
+               trace: TraceCotacao = None) -> TabelaPlanos:
+        """
+        Completa o que faltar (índice/matriz) ou carrega a tabela se nada vier.
+        trace: recebe as etapas da carga/montagem (ver carregar_tabela).
+        """
+        if indice is None and df is None:
+            return self.carregar_tabela(trace=trace)
+
+        # mesmos objetos da chamada anterior -> mesma TabelaPlanos (e mesmas chaves de cache)
+        entrada = (df, indice, matriz)
+        avulsa = self._avulsa
+        if avulsa is not None and all(a is b for a, b in zip(avulsa[0], entrada)):
+            return avulsa[1]
+
+        if indice is None:
+            indice = self.montar_indice(df)
+        if matriz is None:
+            matriz = self.montar_matriz(indice)
+        if trace is not None:
+            trace.marcar("indice", indice.n)
+        tabela = TabelaPlanos(df, indice, matriz)
+        self._avulsa = (entrada, tabela)
+        return tabela
+
+    def carregar_tabela(
+        self,
+        sftp_url: str = None,
+        sheet_name: str = None,
+        snapshot: str = None,
+        store: str = None,
+        trace: TraceCotacao = None,
+    ) -> TabelaPlanos:
+        """
+        Se houver store (argumento ou env_store no .env), abre índice/matriz via
+        mmap e não carrega DF nenhum (df vem None).
+        Senão, se houver snapshot (argumento ou env_snapshot no .env), lê o DF
+        já preparado dele, sem SFTP nem xlsx.
+        Prepara/indexa só quando a versão da planilha muda.
+        trace: recebe as etapas (sem ele, um trace próprio vai para o agregador).
+        """
+        proprio = trace is None
+        if proprio:
+            trace = TraceCotacao(f"carregar_tabela:{self.nome}")
+        try:
+            return self._carregar_tabela(sftp_url, sheet_name, snapshot, store, trace)
+        finally:
+            if proprio:
+                trace.finalizar()
+
+    def _carregar_tabela(self, sftp_url, sheet_name, snapshot, store, trace) -> TabelaPlanos:
+        load_dotenv()
+        store = store or (os.getenv(self.env_store) if self.env_store else None)
+        snapshot = snapshot or (os.getenv(self.env_snapshot) if self.env_snapshot else None)
+
+        with self._lock:
+            atual = self._tabela
+
+            if store and os.path.exists(store):
+                st = os.stat(store)
+                versao = ("store", os.path.abspath(store), st.st_mtime_ns, st.st_size)
+                if atual is not None and atual.versao == versao:
+                    trace.marcar("tabela_reaproveitada")
+                    return atual
+                indice, matriz, _ = abrir_store(store)
+                trace.marcar("abrir_store", indice.n)
+                return self._trocar_tabela(TabelaPlanos(None, indice, matriz, versao))
+
+            if snapshot and os.path.exists(snapshot):
+                st = os.stat(snapshot)
+                versao = ("snapshot", os.path.abspath(snapshot), st.st_mtime_ns, st.st_size)
+                if atual is not None and atual.versao == versao:
+                    trace.marcar("tabela_reaproveitada")
+                    return atual
+                df = ler_snapshot(snapshot)
+                trace.marcar("ler_snapshot", len(df))
+            else:
+                # versão comparada pelo stat remoto, antes de copiar o DataFrame do cache
+                df_raw = self.carregar_planilha(
+                    sftp_url, sheet_name, versao_atual=atual.versao if atual is not None else None, trace=trace
+                )
+                if df_raw is None:
+                    trace.marcar("tabela_reaproveitada")
+                    return atual
+
+                versao = df_raw.attrs.get("versao_planilha")
+
+                df = self.preparar_df(df_raw)
+                trace.marcar("preparo", len(df))
+
+            indice = self.montar_indice(df)
+            matriz = self.montar_matriz(indice)
+            trace.marcar("indice", indice.n)
+            return self._trocar_tabela(TabelaPlanos(df, indice, matriz, versao))
+
+    def _trocar_tabela(self, tabela: TabelaPlanos) -> TabelaPlanos:
+        # as chaves antigas já não casam (impressão nova); limpar só libera memória
+        self.cache.limpar()
+        self._tabela = tabela
+        return tabela
+
+    def converter_xlsx_para_snapshot(self, xlsx_path: str, snapshot_path: str, sheet_name: str = None) -> pd.DataFrame:
+        """
+        Converte a planilha .xlsx local no snapshot do DF_PLANOS já preparado
+        (com _FAIXA_N, _VALOR_NUM e _VIDAS_MIN/_VIDAS_MAX).
+        """
+        sheet_name = sheet_name or self.sheet_name
+        df_raw = pd.read_excel(xlsx_path, sheet_name=sheet_name)
+        df_raw.columns = [str(c).strip() for c in df_raw.columns]
+
+        st = os.stat(xlsx_path)
+        df_raw.attrs["versao_planilha"] = (os.path.abspath(xlsx_path), sheet_name, int(st.st_mtime), st.st_size)
+
+        df = self.preparar_df(df_raw)
+        salvar_snapshot(df, snapshot_path)
+        return df
+
+    def gerar_store(self, store_path: str, df: pd.DataFrame = None) -> TabelaPlanos:
+        """
+        Grava o store (índice + matriz, se houver) lido via mmap pelos workers.
+        Sem df, usa a tabela do carregar_tabela (SFTP/snapshot).
+        """
+        tabela = self.carregar_tabela() if df is None else self.tabela(df=df)
+        attrs = tabela.df.attrs if tabela.df is not None else None
+        salvar_store(store_path, tabela.indice, tabela.matriz, attrs=attrs)
+        return tabela
+
+    # -----------------------
+    # Cotação
+    # -----------------------
+    def _interpretar(self, payload: dict) -> dict:
+        """Payload -> parâmetros já normalizados (os mesmos que decidem o resultado)."""
+        budget, teto = self.margem.aplicar(parse_money_brl(payload.get("valor_estimado")))
+
+        faixas_payload = payload.get("faixa_etaria") or []
+        faixas_payload = [normalize_faixa(x) for x in faixas_payload if x]
+
+        return {
+            "regiao": str(payload.get("regiao", "")).strip().upper(),
+            "porte": str(payload.get("porte_empresarial", "")).strip().upper(),
+            "budget": budget,
+            "teto": teto,
+            "faixas": self.total.faixas(faixas_payload) if faixas_payload else None,
+            "vidas": parse_range_numbers(payload.get("vidas")),
+        }
+
+    def chave_payload(self, payload: dict) -> tuple:
+        """Forma canônica do payload: payloads que dão o mesmo resultado dão a mesma chave."""
+        q = self._interpretar(payload)
+        faixas = None if q["faixas"] is None else self.total.chave_faixas(q["faixas"])
+        return (q["regiao"], q["porte"], q["budget"], q["teto"], faixas, q["vidas"])
+
+    def cotar(
+        self,
+        payload: dict,
+        debug: bool = False,
+        tabela: TabelaPlanos = None,
+        mascaras: dict = None,
+        limit: int = None,
+        offset: int = 0,
+        com_chave: bool = False,
+        trace: TraceCotacao = None,
+    ) -> list:
+        """
+        iterar() materializado, com cache por (impressão da tabela, payload
+        canônico, limit, offset). Com debug não usa o cache (para imprimir as etapas).
+        Cada chamada devolve dicts novos (o cache guarda os originais).
+        trace: recebe as etapas (sem ele, um trace próprio vai para o agregador).
+        """
+        proprio = trace is None
+        if proprio:
+            trace = TraceCotacao(f"buscar_planos:{self.nome}")
+
+        try:
+            if tabela is None:
+                tabela = self.carregar_tabela(trace=trace)
+
+            def calcular():
+                return list(self.iterar(
+                    payload, debug=debug, tabela=tabela, mascaras=mascaras,
+                    limit=limit, offset=offset, com_chave=True, trace=trace,
+                ))
+
+            if debug:
+                itens = calcular()
+            else:
+                chave = (tabela.impressao, self.chave_payload(payload), limit, offset)
+                itens = self.cache.obter(chave)
+                if itens is None:
+                    trace.marcar("cache_falha")
+                    itens = calcular()
+                    self.cache.guardar(chave, itens)
+                else:
+                    trace.marcar("cache_acerto", len(itens))
+
+            if com_chave:
+                return [(k, _copiar_resultado(r)) for k, r in itens]
+            return [_copiar_resultado(r) for _, r in itens]
+        finally:
+            if proprio:
+                trace.finalizar()
+
+    def iterar(
+        self,
+        payload: dict,
+        debug: bool = False,
+        tabela: TabelaPlanos = None,
+        mascaras: dict = None,
+        limit: int = None,
+        offset: int = 0,
+        com_chave: bool = False,
+        trace=TRACE_NULO,
+    ):
+        """
+        Gera os resultados um a um, na ordem do ranking.
+        Só os combos da página (offset/limit) viram dict; com limit, o ranking
+        é top-k (seleção parcial) em vez de ordenar todos os combos.
+
+        mascaras:  cache opcional (região, porte, vidas) -> bitmap, compartilhado entre payloads
+        com_chave: gera (chave_intercalacao, resultado), p/ intercalar com outras operadoras
+        trace:     TraceCotacao que recebe tempo/linhas de cada etapa
+        """
+        if tabela is None:
+            tabela = self.carregar_tabela(trace=trace if trace.ativo else None)
+        indice = tabela.indice
+
+        q = self._interpretar(payload)
+        trace.marcar("payload")
+        regiao, porte = q["regiao"], q["porte"]
+
+        budget, teto = q["budget"], q["teto"]
+        if teto is None:
+            if not self.margem.catalogo:
+                if debug: print("[DEBUG] budget inválido:", payload.get("valor_estimado"))
+                return
+            if debug:
+                print("[DEBUG] Modo CATÁLOGO (sem filtro de preço)")
+        elif debug:
+            print(f"[DEBUG] Modo COM orçamento: {budget} | Teto: {teto}")
+
+        faixas = q["faixas"]
+        if faixas is None:
+            if debug: print("[DEBUG] faixas_payload vazio")
+            return
+
+        vmin_q, vmax_q = q["vidas"]
+
+        def cnt(bits, label, etapa=None):
+            if not (debug or (etapa and trace.ativo)):
+                return
+            n = indice.contar(bits)
+            if debug:
+                print(f"[DEBUG] {label}: {n} linhas")
+            if etapa:
+                trace.marcar(etapa, n)
+
+        # filtros = AND de bitmaps pré-calculados no índice
+        # região/porte/vidas não dependem das faixas -> reaproveitáveis entre payloads
+        chave_filtros = (regiao, porte, vmin_q, vmax_q)
+        bits = mascaras.get(chave_filtros) if mascaras is not None else None
+
+        if bits is None:
+            bits = indice.tudo()
+            cnt(bits, "TOTAL")
+
+            if regiao:
+                bits &= self.filtro_regiao(indice, regiao)
+                cnt(bits, f"APÓS REGIÃO ({regiao})", "filtro_regiao")
+
+            if porte:
+                bits &= indice.bitmap_contem("porte", porte)
+                cnt(bits, f"APÓS PORTE ({porte})", "filtro_porte")
+
+            if vmin_q is not None:
+                bits &= indice.bitmap_vidas(vmin_q, vmax_q)
+                cnt(bits, f"APÓS VIDAS ({vmin_q}-{vmax_q})", "filtro_vidas")
+
+            if mascaras is not None:
+                mascaras[chave_filtros] = bits
+        else:
+            cnt(bits, f"FILTROS REAPROVEITADOS ({regiao}/{porte}/{vmin_q}-{vmax_q})", "filtros_reaproveitados")
+
+        if tabela.df is not None and "_FAIXA_N" not in tabela.df.columns:
+            raise KeyError("Coluna auxiliar _FAIXA_N não existe (prepare o DF antes).")
+
+        res = self.total.combos(tabela, bits, faixas, cnt, debug)
+        if res is None:
+            return
+        agg, contexto = res
+        trace.marcar("agregacao", len(agg))
+
+        if teto is not None:
+            agg_budget = agg[agg["soma_valor"] <= teto]
+            trace.marcar("filtro_orcamento", len(agg_budget))
+
+            if agg_budget.empty:
+                if debug:
+                    top = agg.sort_values("soma_valor", ascending=True).head(10)
+                    print("[DEBUG] Nenhum combo coube no teto. TOP 10:")
+                    print(top[self.chaves + ["soma_valor"]])
+                return
+        else:
+            # sem orçamento → traz tudo
+            agg_budget = agg
+
+        # empate -> regra de total, depois ordem do combo (ordenação estável)
+        soma = agg_budget["soma_valor"].to_numpy()
+        fim_pagina = None if limit is None else offset + limit
+        if teto is not None:
+            # mais perto do teto primeiro (melhor uso do orçamento)
+            rank = np.abs(teto - soma)
+            desempate = self.total.desempate * soma
+            pagina = ordem_top_k((desempate, rank), fim_pagina)
+            # intercalação entre operadoras (cada uma com seu teto): distância
+            # relativa ao teto; mesma ordem do rank dentro da operadora
+            rank = rank / (abs(teto) or 1.0)
+        else:
+            # catálogo → mais barato primeiro
+            rank = soma
+            pagina = ordem_top_k((soma,), fim_pagina)
+        pagina = pagina[offset:]
+        agg_budget = agg_budget.iloc[pagina]
+        trace.marcar("ranking", len(pagina))
+
+        # detalhes em lotes crescentes: o primeiro resultado sai sem montar a
+        # página inteira, e a página toda custa só log(n) lotes
+        rank = rank[pagina]
+        ini, lote = 0, LOTE_DETALHES
+        while ini < len(pagina):
+            fim = ini + lote
+            parte = agg_budget.iloc[ini:fim]
+            combos = zip(
+                *(parte[k].tolist() for k in self.chaves),
+                parte["soma_valor"].tolist(),
+                self.total.detalhes(tabela, contexto, parte),
+                rank[ini:fim].tolist(),
+            )
+
+            for plano, reg, acomodacao, porte_combo, copart, soma_combo, itens, r in combos:
+                resultado = {
+                    "nome_plano": plano,
+                    "regiao": reg,
+                    "acomodacao": acomodacao,
+                    "porte_empresarial": porte_combo,
+                    "copart": copart,
+                    "budget_cliente": float(budget) if budget is not None else None,
+                    "teto_com_margem": float(teto) if teto is not None else None,
+                    "valor_somatoria": f"{float(soma_combo):.2f}",
+                    "detalhes_por_faixa": itens
+                }
+                # empate entre operadoras -> maior soma (igual para todas)
+                yield ((r, -soma_combo), resultado) if com_chave else resultado
+
+            ini, lote = fim, lote * 2
+
+        # montagem dos dicts (inclui o tempo do consumidor entre os yields)
+        trace.marcar("resultados", len(pagina))
@@ -1,5 +1,5 @@
-import requests 
 import pandas as pd 
+from http_utils import criar_sessao, requisitar_todas
 
 # ============================= #
 #  CONFIGURAÇÃO 
@@ -25,6 +25,8 @@ headers = {
     "Referer": "https://kitcorretoramil.com.br/linha-selecionada-pme/tabela-de-precos-pme/" 
 } 
 
+MAX_PARALELO = 8  # requisições simultâneas ao kit
+
 # ============================= 
 # REQUEST 
 # ============================= 
@@ -60,21 +62,28 @@ linhas = [
     "Linha Amil"
 ]
 
-resposta = []
-
+# uma requisição por combinação; saem em paralelo e voltam na ordem do laço
+combinacoes = []
+pedidos = []
 for linha in linhas:
-    payload["Linha"] = linha
     for regiao in regiões:
         for empresa in tipo_empresa:
-            payload["Compulsorio"] = empresa
-            payload["Estado"] = regiao
-            response = requests.post( url, json=payload, # 🔥 ISSO É O PONTO-CHAVE
-                                headers=headers 
-                            ) 
-
-            data = response.json()
-            print(response.status_code, regiao, empresa, linha, len(data))
-            resposta.append({f"{regiao}_{empresa}": data})
+            combinacoes.append((regiao, empresa, linha))
+            pedidos.append({
+                "metodo": "POST",
+                "url": url,
+                "json": {**payload, "Linha": linha, "Compulsorio": empresa, "Estado": regiao},  # 🔥 ISSO É O PONTO-CHAVE
+            })
+
+sessao = criar_sessao(headers, max_paralelo=MAX_PARALELO)
+respostas = requisitar_todas(sessao, pedidos, max_paralelo=MAX_PARALELO)
+
+resposta = []
+
+for (regiao, empresa, linha), response in zip(combinacoes, respostas):
+    data = response.json()
+    print(response.status_code, regiao, empresa, linha, len(data))
+    resposta.append({f"{regiao}_{empresa}": data})
 
 with open("amil_pme_interior_sp_response.json", "w", encoding="utf-8") as f:
     import json
@@ -1,5 +1,5 @@
-import requests
 import pandas as pd
+from http_utils import criar_sessao, requisitar_todas
 
 payload = {
     "linha_de_plano": "Linha Santa Helena PME",
@@ -51,39 +51,45 @@ vidas = [
     "2 a 29",
     "30 a 99"
 ]
-resposta = []
-print("Iniciando requisições...")
+
+MAX_PARALELO = 8  # requisições simultâneas ao kit
+
+# uma requisição por combinação; saem em paralelo e voltam na ordem do laço
+combinacoes = []
+pedidos = []
 for regiao in regioes:
     for vida in vidas:
-        payload['numero_de_vidas_plano'] = vida    
         for tipo in tipos_empresa:
-            payload['regiao_plano'] = regiao
-            payload['contratacao'] = tipo
-
-            
             url = f'https://app.kitcorretoramil.com.br/api/planos/getWithFilters?linha_de_plano=Linha%20Santa%20Helena%20PME&numero_de_vidas_plano={vida.replace(" ", "%20")}&regiao_plano={regiao.replace(" ", "%20")}&contratacao={tipo.replace(" ", "%20")}&verticalizadas=1'
+            combinacoes.append((regiao, vida, tipo))
+            pedidos.append({"metodo": "GET", "url": url})
+
+resposta = []
+print("Iniciando requisições...")
+sessao = criar_sessao(headers, max_paralelo=MAX_PARALELO)
+respostas = requisitar_todas(sessao, pedidos, max_paralelo=MAX_PARALELO)
 
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            dados = response.json()
-            
-            if not isinstance(dados, dict) or 'plans' not in dados:
-                raise Exception(f"❌ Resposta inesperada para Região: {regiao}, Vidas: {vida}, Tipo: {tipo}: {dados}")
-            
-            for plano in dados['plans']:
-                for faixa in faixas:
-                    key = f'precos_{faixa}'
-                    resposta.append({
-                        'Regiao': regiao,
-                        'Plano': plano.get('plano'),
-                        'Vidas': vida,
-                        'Tipo Empresa': tipo,
-                        'Acomodacao': plano.get('acomodacao'),
-                        'Faixa Etaria': faixa.replace("_", "-") if faixa != "59_mais" else "59+",
-                        'Preço': float(plano.get(key)),
-                        'Coparticipação': plano.get('coparticipacao'),
-                        'Contratação': plano.get('contratacao')
-                    })
+for (regiao, vida, tipo), response in zip(combinacoes, respostas):
+    response.raise_for_status()
+    dados = response.json()
+    
+    if not isinstance(dados, dict) or 'plans' not in dados:
+        raise Exception(f"❌ Resposta inesperada para Região: {regiao}, Vidas: {vida}, Tipo: {tipo}: {dados}")
+    
+    for plano in dados['plans']:
+        for faixa in faixas:
+            key = f'precos_{faixa}'
+            resposta.append({
+                'Regiao': regiao,
+                'Plano': plano.get('plano'),
+                'Vidas': vida,
+                'Tipo Empresa': tipo,
+                'Acomodacao': plano.get('acomodacao'),
+                'Faixa Etaria': faixa.replace("_", "-") if faixa != "59_mais" else "59+",
+                'Preço': float(plano.get(key)),
+                'Coparticipação': plano.get('coparticipacao'),
+                'Contratação': plano.get('contratacao')
+            })
 print(resposta)
 
 if not isinstance(dados, dict):
@@ -1,6 +1,5 @@
-import time
-import requests
 import pandas as pd
+from http_utils import LimitadorTaxa, criar_sessao, em_paralelo, requisitar
 
 # =============================
 # CONFIGURAÇÃO
@@ -28,6 +27,11 @@ REGIOES = {
 LINHAS = ["Linha Selecionada", "Linha Amil"]
 TIPOS_REDE = ["Hospitais", "Laboratórios"]
 
+# ritmo do crawl: até TAXA_REQUISICOES req/s e MAX_EM_VOO simultâneas; o
+# limitador reduz sozinho quando o site devolve 429/5xx ou demora demais
+TAXA_REQUISICOES = 4.0
+MAX_EM_VOO = 4
+
 # =============================
 # FUNÇÕES AUXILIARES
 # =============================
@@ -53,7 +57,25 @@ def normaliza_celula(valor):
     return txt
 
 
-def get_planos(sess, produto_slug, estado, linha):
+def get_prestadores(sess, linha, rede_tipo, regiao, estado, limitador=None):
+    """
+    Prestadores de um estado, agrupados por produto (slug):
+      {"<produto>": [[nome, ..., ..., cidade, <coluna por plano>...], ...], ...}
+    """
+    payload_provider = {
+        "pf": "false",
+        "estado": estado,
+        "Tipo de Rede": rede_tipo,
+        "linha": linha,
+        "regiao": regiao,
+    }
+
+    r_prov = requisitar(sess, "POST", URL_PROVIDERS, json=payload_provider, headers=HEADERS, timeout=60, limitador=limitador)
+    r_prov.raise_for_status()
+    return r_prov.json()
+
+
+def get_planos(sess, produto_slug, estado, linha, limitador=None):
     """
     Busca a lista de planos (por produto/estado/linha).
     Resposta típica:
@@ -66,7 +88,7 @@ def get_planos(sess, produto_slug, estado, linha):
         "linhas_de_planos": linha,
     }
 
-    r = sess.post(URL_PLANOS, json=payload_planos, headers=HEADERS, timeout=60)
+    r = requisitar(sess, "POST", URL_PLANOS, json=payload_planos, headers=HEADERS, timeout=60, limitador=limitador)
     r.raise_for_status()
     j = r.json()
 
@@ -80,7 +102,8 @@ def get_planos(sess, produto_slug, estado, linha):
 # EXTRAÇÃO PRINCIPAL
 # =============================
 
-sess = requests.Session()
+sess = criar_sessao(max_paralelo=MAX_EM_VOO)
+limitador = LimitadorTaxa(TAXA_REQUISICOES, MAX_EM_VOO)
 
 dados_consolidados = []
 
@@ -89,87 +112,94 @@ planos_cache = {}  # (produto_slug, estado, linha) -> lista planos
 
 print("🚀 Iniciando extração dos dados...")
 
-for linha in LINHAS:
-    for rede_tipo in TIPOS_REDE:
-        for regiao, estados in REGIOES.items():
-            for estado in estados:
-                print(f"🔄 Buscando: {linha} | {rede_tipo} | {regiao} | {estado}")
-
-                # --- PASSO A: Buscar Prestadores ---
-                payload_provider = {
-                    "pf": "false",
-                    "estado": estado,
-                    "Tipo de Rede": rede_tipo,
-                    "linha": linha,
-                    "regiao": regiao,
-                }
-
-                try:
-                    r_prov = sess.post(URL_PROVIDERS, json=payload_provider, headers=HEADERS, timeout=60)
-                    r_prov.raise_for_status()
-                    data_prov = r_prov.json()
-                except Exception as e:
-                    print(f"❌ Erro na requisição de prestadores ({estado}): {e}")
-                    continue
-
-                if not isinstance(data_prov, dict) or not data_prov:
-                    continue
-
-                # O JSON vem agrupado por produto (slug)
-                for produto_slug, lista_prestadores in data_prov.items():
-                    if not lista_prestadores:
+consultas = [
+    (linha, rede_tipo, regiao, estado)
+    for linha in LINHAS
+    for rede_tipo in TIPOS_REDE
+    for regiao, estados in REGIOES.items()
+    for estado in estados
+]
+
+
+# --- PASSO A: Buscar Prestadores (todas as consultas, no ritmo do limitador) ---
+respostas_prov = em_paralelo(
+    lambda consulta: get_prestadores(sess, *consulta, limitador=limitador), consultas,
+    max_paralelo=MAX_EM_VOO, excecoes=True,
+)
+
+# --- PASSO B: Buscar Planos de cada Produto/Estado/Linha (uma vez cada) ---
+chaves_planos = list(dict.fromkeys(
+    (produto_slug, estado, linha)
+    for (linha, _, _, estado), data_prov in zip(consultas, respostas_prov)
+    if isinstance(data_prov, dict)
+    for produto_slug, lista_prestadores in data_prov.items()
+    if lista_prestadores
+))
+respostas_planos = em_paralelo(
+    lambda chave: get_planos(sess, *chave, limitador=limitador), chaves_planos,
+    max_paralelo=MAX_EM_VOO, excecoes=True,
+)
+planos_cache.update(zip(chaves_planos, respostas_planos))
+
+# Processa na ordem das consultas: cada erro sai junto do seu "Buscando"
+for (linha, rede_tipo, regiao, estado), data_prov in zip(consultas, respostas_prov):
+    print(f"🔄 Buscando: {linha} | {rede_tipo} | {regiao} | {estado}")
+
+    if isinstance(data_prov, Exception):
+        print(f"❌ Erro na requisição de prestadores ({estado}): {data_prov}")
+        continue
+
+    if not isinstance(data_prov, dict) or not data_prov:
+        continue
+
+    # O JSON vem agrupado por produto (slug)
+    for produto_slug, lista_prestadores in data_prov.items():
+        if not lista_prestadores:
+            continue
+
+        cache_key = (produto_slug, estado, linha)
+        planos = planos_cache[cache_key]
+        if isinstance(planos, Exception):
+            # erro avisado uma vez, no primeiro uso da chave
+            print(f"⚠️ Erro ao buscar planos para {produto_slug} ({estado}/{linha}): {planos}")
+            planos = planos_cache[cache_key] = []
+        if not planos:
+            continue
+
+        # --- PASSO C: Cruzar Dados (Matriz) ---
+        for prestador in lista_prestadores:
+            try:
+                nome_prestador = prestador[0]
+                cidade_prestador = prestador[3] if len(prestador) > 3 else "N/A"
+
+                # Colunas fixas: 0..3
+                # Colunas por plano começam em 4
+                for i, plano_obj in enumerate(planos):
+                    plano_nome = plano_obj.get("attributes", {}).get("plano", "")
+                    idx_coluna = 4 + i
+
+                    if idx_coluna >= len(prestador):
                         continue
 
-                    # --- PASSO B: Buscar Planos para este Produto/Estado/Linha (com cache) ---
-                    cache_key = (produto_slug, estado, linha)
-                    if cache_key not in planos_cache:
-                        try:
-                            planos_cache[cache_key] = get_planos(sess, produto_slug, estado, linha)
-                        except Exception as e:
-                            print(f"⚠️ Erro ao buscar planos para {produto_slug} ({estado}/{linha}): {e}")
-                            planos_cache[cache_key] = []
-
-                    planos = planos_cache[cache_key]
-                    if not planos:
+                    valor_celula = prestador[idx_coluna]
+                    status = normaliza_celula(valor_celula)
+                    if not status:
                         continue
 
-                    # --- PASSO C: Cruzar Dados (Matriz) ---
-                    for prestador in lista_prestadores:
-                        try:
-                            nome_prestador = prestador[0]
-                            cidade_prestador = prestador[3] if len(prestador) > 3 else "N/A"
-
-                            # Colunas fixas: 0..3
-                            # Colunas por plano começam em 4
-                            for i, plano_obj in enumerate(planos):
-                                plano_nome = plano_obj.get("attributes", {}).get("plano", "")
-                                idx_coluna = 4 + i
-
-                                if idx_coluna >= len(prestador):
-                                    continue
-
-                                valor_celula = prestador[idx_coluna]
-                                status = normaliza_celula(valor_celula)
-                                if not status:
-                                    continue
-
-                                dados_consolidados.append({
-                                    "Linha": linha,
-                                    "Tipo Rede": rede_tipo,
-                                    "Região": regiao,
-                                    "Estado": estado,
-                                    "Cidade": cidade_prestador,
-                                    "Produto": produto_slug,
-                                    "Plano": plano_nome,
-                                    "Prestador": nome_prestador,
-                                    "Modalidade": status
-                                })
-                        except Exception:
-                            # ignora erro pontual por prestador
-                            pass
-
-                # pequeno delay pra evitar bloqueio
-                time.sleep(0.4)
+                    dados_consolidados.append({
+                        "Linha": linha,
+                        "Tipo Rede": rede_tipo,
+                        "Região": regiao,
+                        "Estado": estado,
+                        "Cidade": cidade_prestador,
+                        "Produto": produto_slug,
+                        "Plano": plano_nome,
+                        "Prestador": nome_prestador,
+                        "Modalidade": status
+                    })
+            except Exception:
+                # ignora erro pontual por prestador
+                pass
 
 # =============================
 # EXPORTAÇÃO
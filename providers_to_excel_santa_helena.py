@@ -1,6 +1,5 @@
-import time
-import requests
 import pandas as pd
+from http_utils import LimitadorTaxa, criar_sessao, em_paralelo, requisitar
 
 # =============================
 # CONFIGURAÇÃO
@@ -38,7 +37,11 @@ REGIOES_ID = {
 PRODUTOS = ["diamante"]  # se tiver outros, adicione aqui: ["diamante", "ouro", "prata", ...]
 
 TIMEOUT = 60
-DELAY = 0.25
+
+# ritmo do crawl: até TAXA_REQUISICOES req/s e MAX_EM_VOO simultâneas; o
+# limitador reduz sozinho quando o site devolve 429/5xx ou demora demais
+TAXA_REQUISICOES = 4.0
+MAX_EM_VOO = 4
 
 
 # =============================
@@ -64,14 +67,14 @@ def is_credenciado(rel):
     return isinstance(plano_obj, dict) and bool(plano_obj.get("plano"))
 
 
-def fetch_rede(sess, regiao_id, linha, produto, tipo):
+def fetch_rede(sess, regiao_id, linha, produto, tipo, limitador=None):
     params = {
         "regiao": str(regiao_id),
         "linha": linha,
         "produto": produto,
         "tipo": tipo,
     }
-    r = sess.get(BASE_URL, params=params, headers=HEADERS, timeout=TIMEOUT)
+    r = requisitar(sess, "GET", BASE_URL, params=params, headers=HEADERS, timeout=TIMEOUT, limitador=limitador)
     r.raise_for_status()
     return r.json()
 
@@ -79,65 +82,75 @@ def fetch_rede(sess, regiao_id, linha, produto, tipo):
 # =============================
 # EXTRAÇÃO PRINCIPAL
 # =============================
-sess = requests.Session()
+sess = criar_sessao(max_paralelo=MAX_EM_VOO)
+limitador = LimitadorTaxa(TAXA_REQUISICOES, MAX_EM_VOO)
 dados_consolidados = []
 
 print("🚀 Iniciando extração Santa Helena (getByPlan)...")
 
-for linha in LINHAS:
-    for tipo_rede_label, tipo_param in TIPOS_REDE.items():
-        for regiao_label, regiao_id in REGIOES_ID.items():
-            for produto in PRODUTOS:
-                print(f"🔄 Buscando: {linha} | {tipo_rede_label} | {regiao_label} | produto={produto}")
-
-                try:
-                    payload = fetch_rede(sess, regiao_id, linha, produto, tipo_param)
-                except Exception as e:
-                    print(f"❌ Erro na requisição ({regiao_label}/{tipo_rede_label}/{produto}): {e}")
-                    continue
-
-                data = payload.get("data", [])
-                if not isinstance(data, list) or not data:
-                    time.sleep(DELAY)
-                    continue
-
-                for item in data:
-                    attrs = item.get("attributes", {}) if isinstance(item, dict) else {}
-                    if not isinstance(attrs, dict):
-                        continue
-
-                    prestador = (attrs.get("nome") or "").strip()
-                    cidade = (attrs.get("cidade") or "").strip()
-
-                    # No response: "regiao": "METROPOLITANA DE SÃO PAULO"
-                    estado_macro = (attrs.get("regiao") or "").strip()
-
-                    relacoes = attrs.get("relacoes", [])
-                    if not isinstance(relacoes, list) or not relacoes:
-                        continue
-
-                    for rel in relacoes:
-                        if not is_credenciado(rel):
-                            continue
-
-                        modalidade = rel.get("atributos")
-                        plano_obj = rel.get("planos_rede_credenciada", {}) or {}
-                        plano = (plano_obj.get("plano") or "").strip()
-
-                        # Monta EXATAMENTE as colunas que você pediu
-                        dados_consolidados.append({
-                            "Linha": linha,
-                            "Tipo Rede": tipo_rede_label,
-                            "Região": regiao_label,
-                            "Estado": estado_macro,
-                            "Cidade": cidade,
-                            "Produto": produto,
-                            "Plano": plano,
-                            "Prestador": prestador,
-                            "Modalidade": modalidade,
-                        })
-
-                time.sleep(DELAY)
+consultas = [
+    (linha, tipo_rede_label, tipo_param, regiao_label, regiao_id, produto)
+    for linha in LINHAS
+    for tipo_rede_label, tipo_param in TIPOS_REDE.items()
+    for regiao_label, regiao_id in REGIOES_ID.items()
+    for produto in PRODUTOS
+]
+
+
+def buscar_consulta(consulta):
+    linha, _, tipo_param, _, regiao_id, produto = consulta
+    return fetch_rede(sess, regiao_id, linha, produto, tipo_param, limitador=limitador)
+
+
+# todas as consultas no ritmo do limitador; respostas (ou erro) na ordem acima
+respostas = em_paralelo(buscar_consulta, consultas, max_paralelo=MAX_EM_VOO, excecoes=True)
+
+for (linha, tipo_rede_label, tipo_param, regiao_label, regiao_id, produto), payload in zip(consultas, respostas):
+    print(f"🔄 Buscando: {linha} | {tipo_rede_label} | {regiao_label} | produto={produto}")
+
+    if isinstance(payload, Exception):
+        print(f"❌ Erro na requisição ({regiao_label}/{tipo_rede_label}/{produto}): {payload}")
+        continue
+
+    data = payload.get("data", [])
+    if not isinstance(data, list) or not data:
+        continue
+
+    for item in data:
+        attrs = item.get("attributes", {}) if isinstance(item, dict) else {}
+        if not isinstance(attrs, dict):
+            continue
+
+        prestador = (attrs.get("nome") or "").strip()
+        cidade = (attrs.get("cidade") or "").strip()
+
+        # No response: "regiao": "METROPOLITANA DE SÃO PAULO"
+        estado_macro = (attrs.get("regiao") or "").strip()
+
+        relacoes = attrs.get("relacoes", [])
+        if not isinstance(relacoes, list) or not relacoes:
+            continue
+
+        for rel in relacoes:
+            if not is_credenciado(rel):
+                continue
+
+            modalidade = rel.get("atributos")
+            plano_obj = rel.get("planos_rede_credenciada", {}) or {}
+            plano = (plano_obj.get("plano") or "").strip()
+
+            # Monta EXATAMENTE as colunas que você pediu
+            dados_consolidados.append({
+                "Linha": linha,
+                "Tipo Rede": tipo_rede_label,
+                "Região": regiao_label,
+                "Estado": estado_macro,
+                "Cidade": cidade,
+                "Produto": produto,
+                "Plano": plano,
+                "Prestador": prestador,
+                "Modalidade": modalidade,
+            })
 
 # =============================
 # EXPORTAÇÃO
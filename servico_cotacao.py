@@ -0,0 +1,326 @@
+import os
+import re
+import json
+import math
+import asyncio
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import numpy as np
+import pandas as pd
+
+import buscar_planos_todas
+import buscar_rede_credenciada
+from trace_cotacao import AGREGADOR, TraceCotacao, TRACE_NULO
+
+# -----------------------
+# Serviço HTTP local de cotação (processo quente, tabelas em memória)
+# -----------------------
+# POST /planos                todas as operadoras, num ranking só
+# POST /planos/amil           payload do buscar_planos (Amil)
+# POST /planos/santa-helena   payload do buscar_planos (Santa Helena)
+#                             ?limit=N&offset=M -> só essa página do ranking
+# POST /rede                  payload do buscar_rede_credenciada
+#                             ?facetas=1 -> {"resultados", "facetas"} (contagens p/ barra de filtros)
+# POST /rede/autocompletar    {"campo": cidade|prestador|plano, "prefixo", "estado"?, "linha"?, "limite"?}
+# POST /recarregar            relê as tabelas (só troca se a planilha mudou)
+# GET  /saude                 status das tabelas carregadas
+# GET  /tempos                p50/p95/p99 de cada etapa (cotação, rede, cargas, HTTP)
+#
+# Todo trabalho bloqueante (SFTP, pandas) roda no executor; o event loop só
+# lê/escreve HTTP, então continua atendendo enquanto uma cotação calcula.
+HOST = "127.0.0.1"
+PORT = 8080
+
+TAMANHO_MAX_CORPO = 1024 * 1024
+
+_STATUS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class ErroHTTP(Exception):
+    def __init__(self, status: int, mensagem: str):
+        super().__init__(mensagem)
+        self.status = status
+        self.mensagem = mensagem
+
+
+def _json_default(o):
+    if o is pd.NaT:
+        return None
+    # escalares NumPy (np.int64 etc.) que sobram nos resultados
+    if hasattr(o, "item"):
+        return o.item()
+    return str(o)
+
+
+def _sem_nan(o):
+    """NaN/inf/NaT -> None em dicts/listas (JSON não tem NaN)."""
+    if isinstance(o, dict):
+        return {k: _sem_nan(v) for k, v in o.items()}
+    if isinstance(o, (list, tuple)):
+        return [_sem_nan(v) for v in o]
+    if o is pd.NaT:
+        return None
+    if isinstance(o, np.generic):
+        o = o.item()
+    if isinstance(o, float) and not math.isfinite(o):
+        return None
+    return o
+
+
+def _json(obj) -> bytes:
+    """JSON estrito (allow_nan=False); só percorre o objeto trocando NaN quando ele tem algum."""
+    try:
+        corpo = json.dumps(obj, ensure_ascii=False, allow_nan=False, default=_json_default)
+    except ValueError:
+        corpo = json.dumps(_sem_nan(obj), ensure_ascii=False, allow_nan=False, default=_json_default)
+    return corpo.encode("utf-8")
+
+
+def _pagina(params: dict) -> dict:
+    """?limit=&offset= -> kwargs do buscar_planos"""
+    try:
+        limit = int(params["limit"]) if params.get("limit") else None
+        offset = int(params.get("offset") or 0)
+    except ValueError:
+        raise ErroHTTP(400, "limit/offset devem ser inteiros")
+    if (limit is not None and limit < 0) or offset < 0:
+        raise ErroHTTP(400, "limit/offset não podem ser negativos")
+    return {"limit": limit, "offset": offset}
+
+
+class ServicoCotacao:
+    """
+    Carrega as tabelas uma vez (carregar) e atende as rotas com elas.
+    As buscas só leem índice/DF, então várias podem rodar em paralelo no executor.
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cotacao")
+        self.tabelas = {}
+        self.rotas = {
+            "/planos": self._planos,
+            "/planos/amil": self._planos_amil,
+            "/planos/santa-helena": self._planos_santa_helena,
+            "/rede": self._rede,
+            "/rede/autocompletar": self._rede_autocompletar,
+        }
+
+    async def _no_executor(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    # -----------------------
+    # Tabelas
+    # -----------------------
+    async def carregar(self):
+        """Carrega as tabelas em paralelo (SFTP + preparo no executor)."""
+        planos, rede = await asyncio.gather(
+            self._no_executor(buscar_planos_todas.carregar_tabelas),
+            self._no_executor(buscar_rede_credenciada.carregar_tabela_rede),
+        )
+        self.tabelas = {**planos, "rede": rede}
+
+    def _tabela(self, nome: str):
+        tabela = self.tabelas.get(nome)
+        if tabela is None:
+            raise ErroHTTP(503, f"Tabela {nome} não carregada")
+        return tabela
+
+    # -----------------------
+    # Rotas
+    # -----------------------
+    async def _planos(self, payload: dict, params: dict):
+        tabelas = {nome: self._tabela(nome) for nome in buscar_planos_todas.OPERADORAS}
+        return await self._no_executor(
+            buscar_planos_todas.buscar_planos, payload, tabelas=tabelas, **_pagina(params)
+        )
+
+    async def _planos_operadora(self, nome: str, payload: dict, params: dict):
+        operadora = buscar_planos_todas.OPERADORAS[nome]
+        tabela = self._tabela(nome)
+        return await self._no_executor(
+            operadora.cotar, payload, tabela=tabela, **_pagina(params)
+        )
+
+    async def _planos_amil(self, payload: dict, params: dict):
+        return await self._planos_operadora("amil", payload, params)
+
+    async def _planos_santa_helena(self, payload: dict, params: dict):
+        return await self._planos_operadora("santa_helena", payload, params)
+
+    async def _rede(self, payload: dict, params: dict):
+        df = self._tabela("rede")
+        facetas = params.get("facetas", "").lower() in ("1", "true", "sim")
+        try:
+            return await self._no_executor(
+                buscar_rede_credenciada.buscar_rede_credenciada, payload, df=df, facetas=facetas
+            )
+        except re.error as e:
+            # q com metacaractere vira regex: padrão inválido é erro de quem chamou
+            raise ErroHTTP(400, f"q não é uma regex válida: {e}")
+
+    async def _rede_autocompletar(self, payload: dict, params: dict):
+        df = self._tabela("rede")
+        try:
+            limite = int(payload.get("limite", buscar_rede_credenciada.LIMITE_AUTOCOMPLETE))
+        except (TypeError, ValueError):
+            raise ErroHTTP(400, "limite deve ser inteiro")
+        try:
+            return await self._no_executor(
+                buscar_rede_credenciada.autocompletar,
+                payload.get("campo"), payload.get("prefixo") or "",
+                estado=payload.get("estado"), linha=payload.get("linha"), limite=limite, df=df,
+            )
+        except ValueError as e:
+            raise ErroHTTP(400, str(e))
+
+    async def _saude(self):
+        return {"tabelas": {nome: tabela is not None for nome, tabela in self.tabelas.items()}}
+
+    async def atender(self, metodo: str, caminho: str, corpo: bytes, params: dict = None):
+        """-> (status, objeto JSON de resposta)"""
+        if caminho == "/saude":
+            return 200, await self._saude()
+
+        if caminho == "/tempos":
+            return 200, AGREGADOR.resumo()
+
+        if caminho == "/recarregar":
+            if metodo != "POST":
+                raise ErroHTTP(405, "Use POST")
+            await self.carregar()
+            return 200, await self._saude()
+
+        rota = self.rotas.get(caminho)
+        if rota is None:
+            raise ErroHTTP(404, f"Rota desconhecida: {caminho}")
+        if metodo != "POST":
+            raise ErroHTTP(405, "Use POST com payload JSON")
+
+        try:
+            payload = json.loads(corpo.decode("utf-8") or "{}")
+        except (UnicodeDecodeError, ValueError):
+            raise ErroHTTP(400, "Corpo não é JSON válido")
+        if not isinstance(payload, dict):
+            raise ErroHTTP(400, "Payload deve ser um objeto JSON")
+
+        return 200, await rota(payload, params or {})
+
+    # -----------------------
+    # HTTP/1.1 mínimo (keep-alive, Content-Length)
+    # -----------------------
+    async def _ler_requisicao(self, reader: asyncio.StreamReader):
+        linha = await reader.readline()
+        if not linha:
+            return None
+
+        try:
+            metodo, alvo, versao = linha.decode("latin-1").split()
+        except ValueError:
+            raise ErroHTTP(400, "Linha de requisição inválida")
+
+        cabecalhos = {}
+        while True:
+            linha = await reader.readline()
+            if linha in (b"\r\n", b"\n", b""):
+                break
+            nome, _, valor = linha.decode("latin-1").partition(":")
+            cabecalhos[nome.strip().lower()] = valor.strip()
+
+        try:
+            tamanho = int(cabecalhos.get("content-length") or 0)
+        except ValueError:
+            raise ErroHTTP(400, "Content-Length inválido")
+        if tamanho > TAMANHO_MAX_CORPO:
+            raise ErroHTTP(413, "Payload grande demais")
+        corpo = await reader.readexactly(tamanho) if tamanho else b""
+
+        manter = cabecalhos.get("connection", "").lower() != "close" and versao.upper() == "HTTP/1.1"
+        caminho, _, query = alvo.partition("?")
+        params = {k: v[-1] for k, v in parse_qs(query).items()}
+        return metodo.upper(), caminho, params, corpo, manter
+
+    async def _responder(self, writer: asyncio.StreamWriter, status: int, obj, manter: bool, trace=TRACE_NULO):
+        corpo = _json(obj)
+        trace.marcar("serializacao", bytes=len(corpo))
+        cabecalho = (
+            f"HTTP/1.1 {status} {_STATUS.get(status, '')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(corpo)}\r\n"
+            f"Connection: {'keep-alive' if manter else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(cabecalho.encode("latin-1") + corpo)
+        await writer.drain()
+        trace.marcar("envio")
+
+    async def tratar_conexao(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    req = await self._ler_requisicao(reader)
+                except ErroHTTP as e:
+                    await self._responder(writer, e.status, {"erro": e.mensagem}, False)
+                    break
+                if req is None:
+                    break
+
+                metodo, caminho, params, corpo, manter = req
+                # rota desconhecida não vira operação nova no agregador
+                conhecida = caminho in self.rotas or caminho in ("/saude", "/recarregar", "/tempos")
+                trace = TraceCotacao(f"http:{caminho if conhecida else '?'}")
+                try:
+                    status, obj = await self.atender(metodo, caminho, corpo, params)
+                except ErroHTTP as e:
+                    status, obj = e.status, {"erro": e.mensagem}
+                except Exception as e:
+                    status, obj = 500, {"erro": f"{type(e).__name__}: {e}"}
+                trace.marcar("atendimento")
+
+                await self._responder(writer, status, obj, manter, trace)
+                trace.finalizar()
+                if not manter:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def servir(self, host: str = HOST, port: int = PORT):
+        await self.carregar()
+        server = await asyncio.start_server(self.tratar_conexao, host, port)
+        print(f"[INFO] Serviço de cotação em http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    load_dotenv()
+    host = os.getenv("COTACAO_HOST") or HOST
+    port = int(os.getenv("COTACAO_PORT") or PORT)
+    workers = os.getenv("COTACAO_WORKERS")
+
+    servico = ServicoCotacao(max_workers=int(workers) if workers else None)
+    try:
+        asyncio.run(servico.servir(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servico.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
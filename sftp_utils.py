@@ -0,0 +1,450 @@
+import os
+import io
+import re
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import pandas as pd
+import paramiko
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+from snapshot_tabelas import ler_snapshot, salvar_snapshot
+from trace_cotacao import TRACE_NULO
+
+# -----------------------
+# Cache local de planilhas baixadas via SFTP
+# -----------------------
+# Diretório do cache em disco; None = SFTP_CACHE_DIR do .env / ambiente
+# (lido na hora de usar, depois do load_dotenv), senão <tmp>/sftp_cache
+CACHE_DIR = None
+
+# (caminho_local, sheet_name) -> (mtime, size, DataFrame)
+_DF_CACHE = {}
+_LOCK = threading.Lock()
+
+
+def _cache_dir(cache_dir: str = None) -> str:
+    if cache_dir or CACHE_DIR:
+        return cache_dir or CACHE_DIR
+    load_dotenv()
+    return os.getenv("SFTP_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "sftp_cache")
+
+
+def _caminhos_cache(remote_path: str, cache_dir: str):
+    """
+    remote_path -> (arquivo_local, arquivo_meta)
+    O hash evita colisão entre arquivos de mesmo nome em pastas diferentes.
+    """
+    chave = hashlib.sha1(remote_path.encode("utf-8")).hexdigest()[:16]
+    nome = os.path.basename(remote_path) or "arquivo"
+    local_path = os.path.join(cache_dir, f"{chave}_{nome}")
+    return local_path, local_path + ".meta.json"
+
+
+def _ler_meta(meta_path: str):
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _gravar_atomico(path: str, escrever):
+    # grava num .tmp e troca de uma vez (outro processo nunca vê arquivo pela metade)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        escrever(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# -----------------------
+# Download em faixas paralelas
+# -----------------------
+# f.read() sozinho vira uma sequência de leituras de 32 KB, cada uma esperando
+# a ida e volta ao servidor. Aqui o arquivo é dividido em faixas lidas ao mesmo
+# tempo, cada uma num canal SFTP próprio sobre o mesmo transport (sem outro
+# handshake), direto no buffer final já alocado.
+# (O prefetch do paramiko às vezes trava alguns segundos quando o leitor alcança
+# a thread que dispara as requisições, por isso não é usado.)
+PARTES_SFTP = 8                          # faixas lidas em paralelo
+TAMANHO_MIN_PARTE_SFTP = 512 * 1024      # abaixo disso não compensa abrir outro canal
+BLOCO_LEITURA_SFTP = 1024 * 1024         # quanto ler por chamada dentro de uma faixa
+
+
+def _ler_faixa(sftp, remote_path: str, visao: memoryview, inicio: int, fim: int) -> int:
+    """Lê [inicio, fim) do arquivo em visao[inicio:fim]. -> bytes lidos"""
+    pos = inicio
+    with sftp.open(remote_path, "rb") as f:
+        f.seek(inicio)
+        while pos < fim:
+            with visao[pos:min(pos + BLOCO_LEITURA_SFTP, fim)] as bloco:
+                n = f.readinto(bloco)
+            if not n:
+                break
+            pos += n
+    return pos - inicio
+
+
+def _ler_faixa_canal_novo(transport, remote_path: str, visao: memoryview, inicio: int, fim: int) -> int:
+    sftp = paramiko.SFTPClient.from_transport(transport)
+    try:
+        return _ler_faixa(sftp, remote_path, visao, inicio, fim)
+    finally:
+        sftp.close()
+
+
+def baixar_sftp(sftp, remote_path: str, tamanho: int = None, partes: int = PARTES_SFTP) -> dict:
+    """
+    Baixa remote_path inteiro num buffer já alocado do tamanho do arquivo,
+    em até `partes` faixas paralelas.
+    tamanho: st_size já conhecido (evita outro stat).
+    -> {"dados": bytearray, "bytes": n, "segundos": t}
+    """
+    inicio = time.perf_counter()
+    if tamanho is None:
+        tamanho = int(sftp.stat(remote_path).st_size or 0)
+
+    partes = max(1, min(partes, tamanho // TAMANHO_MIN_PARTE_SFTP))
+    limites = [tamanho * i // partes for i in range(partes + 1)]
+
+    dados = bytearray(tamanho)
+    with memoryview(dados) as visao:
+        if partes == 1:
+            lidos = [_ler_faixa(sftp, remote_path, visao, 0, tamanho)]
+        else:
+            # faixa 0 no canal recebido; as outras em canais novos do mesmo transport
+            transport = sftp.get_channel().get_transport()
+            with ThreadPoolExecutor(max_workers=partes - 1) as ex:
+                futuros = [
+                    ex.submit(_ler_faixa_canal_novo, transport, remote_path, visao, limites[i], limites[i + 1])
+                    for i in range(1, partes)
+                ]
+                lidos = [_ler_faixa(sftp, remote_path, visao, limites[0], limites[1])]
+                lidos += [f.result() for f in futuros]
+
+    # o arquivo mudou depois do stat (faixa incompleta ou tamanho novo): lê inteiro de novo
+    completo = all(n == limites[i + 1] - limites[i] for i, n in enumerate(lidos))
+    if not completo or int(sftp.stat(remote_path).st_size or 0) != tamanho:
+        with sftp.open(remote_path, "rb") as f:
+            dados = bytearray(f.read())
+
+    return {"dados": dados, "bytes": len(dados), "segundos": time.perf_counter() - inicio}
+
+
+def marcar_download(trace, d: dict):
+    """Registra o download (bytes, segundos, MB/s) no trace; sem print (roda no serviço a cada recarga)."""
+    mb = d["bytes"] / (1024 * 1024)
+    taxa = mb / d["segundos"] if d["segundos"] > 0 else 0.0
+    trace.marcar("download", bytes=d["bytes"], segundos_download=round(d["segundos"], 3), mb_s=round(taxa, 2))
+
+
+def baixar_sftp_com_cache(sftp, remote_path: str, cache_dir: str = None, trace=TRACE_NULO):
+    """
+    Mantém uma cópia local de remote_path.
+    Só baixa de novo quando o sftp.stat() reporta mtime/size diferentes.
+    -> (caminho_local, mtime, size)
+    """
+    cache_dir = _cache_dir(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    local_path, meta_path = _caminhos_cache(remote_path, cache_dir)
+
+    # valida existência + pega versão remota
+    st = sftp.stat(remote_path)
+    mtime = int(st.st_mtime or 0)
+    size = int(st.st_size or 0)
+    trace.marcar("sftp_stat")
+
+    meta = _ler_meta(meta_path)
+    if (
+        meta
+        and meta.get("remote_path") == remote_path
+        and meta.get("mtime") == mtime
+        and meta.get("size") == size
+        and os.path.exists(local_path)
+        and os.path.getsize(local_path) == size
+    ):
+        return local_path, mtime, size
+
+    download = {}
+
+    def baixar(tmp_path):
+        download.update(baixar_sftp(sftp, remote_path, tamanho=size))
+        with open(tmp_path, "wb") as out:
+            out.write(download["dados"])
+
+    def gravar_meta(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "remote_path": remote_path, "mtime": mtime, "size": size,
+                "bytes_baixados": download["bytes"], "segundos_download": round(download["segundos"], 3),
+            }, f)
+
+    _gravar_atomico(local_path, baixar)
+    _gravar_atomico(meta_path, gravar_meta)
+    marcar_download(trace, download)
+    return local_path, mtime, size
+
+
+def ler_excel_sftp_cache(sftp, remote_path: str, sheet_name: str, cache_dir: str = None,
+                         em_memoria: bool = True, versao_atual=None, trace=TRACE_NULO) -> pd.DataFrame:
+    """
+    Igual ao ler_excel_sftp, mas reaproveita o arquivo em disco e o
+    DataFrame já parseado enquanto o arquivo remoto não mudar.
+    em_memoria=False: não guarda o DataFrame no processo (quem chama mantém
+    a própria versão compacta; a próxima leitura sai do snapshot em disco).
+    versao_atual: versão que quem chama já tem preparada; se o stat remoto
+    bater com ela, devolve None sem ler nem copiar DataFrame nenhum.
+    """
+    local_path, mtime, size = baixar_sftp_com_cache(sftp, remote_path, cache_dir=cache_dir, trace=trace)
+
+    # versão da planilha (acompanha as cópias) -> quem prepara/indexa sabe quando reaproveitar
+    versao = (remote_path, sheet_name, mtime, size)
+    if versao_atual is not None and versao_atual == versao:
+        trace.marcar("versao_igual")
+        return None
+
+    chave = (local_path, sheet_name)
+    with _LOCK:
+        hit = _DF_CACHE.get(chave)
+    if hit is not None and hit[0] == mtime and hit[1] == size:
+        df = hit[2].copy()
+        trace.marcar("df_em_memoria", len(df))
+        return df
+
+    # processo novo: tenta o snapshot binário antes de parsear o xlsx de novo
+    aba = re.sub(r"[^\w.-]", "_", str(sheet_name))
+    snap_path = f"{local_path}.{aba}.npz"
+    df = None
+    if os.path.exists(snap_path):
+        try:
+            df = ler_snapshot(snap_path)
+        except (OSError, ValueError, KeyError):
+            df = None
+        if df is not None and df.attrs.get("versao_planilha") != versao:
+            df = None
+        if df is not None:
+            trace.marcar("ler_snapshot", len(df))
+
+    if df is None:
+        df = pd.read_excel(local_path, sheet_name=sheet_name)
+        df.columns = [str(c).strip() for c in df.columns]
+        df.attrs["versao_planilha"] = versao
+        trace.marcar("parse_excel", len(df))
+        try:
+            salvar_snapshot(df, snap_path)
+        except OSError:
+            pass  # snapshot é só atalho; sem ele segue pelo xlsx
+        trace.marcar("salvar_snapshot")
+
+    if not em_memoria:
+        return df
+    with _LOCK:
+        _DF_CACHE[chave] = (mtime, size, df)
+    return df.copy()
+
+
+def limpar_cache_sftp(cache_dir: str = None):
+    """Descarta o cache em memória e os arquivos baixados."""
+    cache_dir = _cache_dir(cache_dir)
+    with _LOCK:
+        _DF_CACHE.clear()
+    if not os.path.isdir(cache_dir):
+        return
+    for nome in os.listdir(cache_dir):
+        try:
+            os.remove(os.path.join(cache_dir, nome))
+        except OSError:
+            pass
+
+
+# -----------------------
+# SFTP: parse + connect + read excel
+# -----------------------
+def parse_sftp_url(sftp_url: str):
+    """
+    sftp://user@host:port/remote/path.xlsx
+    -> (host, port, user, remote_path)
+    """
+    u = urlparse(sftp_url)
+    if u.scheme.lower() != "sftp":
+        raise ValueError("URL deve começar com sftp://")
+
+    host = u.hostname
+    port = u.port or 22
+    user = u.username
+    remote_path = u.path  # começa com "/"
+
+    if not host or not user or not remote_path:
+        raise ValueError("URL SFTP inválida (host/user/path).")
+
+    return host, port, user, remote_path
+
+
+def conectar_sftp(host: str, port: int, user: str, password: str):
+    transport = paramiko.Transport((host, int(port)))
+    transport.connect(username=user, password=password)
+    sftp = paramiko.SFTPClient.from_transport(transport)
+    return sftp, transport
+
+
+# -----------------------
+# Pool de conexões SFTP
+# -----------------------
+# Handshake SSH + autenticação custam mais que o stat de uma planilha que não
+# mudou: as conexões ficam abertas (com keepalive) por host/porta/usuário e
+# são reaproveitadas nas próximas cargas.
+KEEPALIVE_SFTP = 30        # segundos entre keepalives do transport ocioso
+MAX_OCIOSAS_SFTP = 2       # conexões paradas guardadas por host/porta/usuário
+
+
+def _fechar_conexao(sftp, transport):
+    try:
+        if sftp:
+            sftp.close()
+    finally:
+        if transport:
+            transport.close()
+
+
+def _conexao_saudavel(sftp, transport) -> bool:
+    return (
+        transport.is_active()
+        and transport.is_authenticated()
+        and not sftp.get_channel().closed
+    )
+
+
+class PoolSFTP:
+    """
+    Conexões (sftp, transport) autenticadas, por (host, port, user).
+    Cada uso pega uma conexão só para si (SFTPClient não é thread-safe) e a
+    devolve no fim; threads diferentes usam conexões diferentes.
+    """
+
+    def __init__(self, keepalive: int = KEEPALIVE_SFTP, max_ociosas: int = MAX_OCIOSAS_SFTP):
+        self.keepalive = keepalive
+        self.max_ociosas = max_ociosas
+        self._ociosas = {}  # (host, port, user) -> [(sftp, transport)]
+        self._lock = threading.Lock()
+
+    def _pegar(self, chave):
+        # a mais recente primeiro; as que morreram enquanto paradas são descartadas
+        while True:
+            with self._lock:
+                livres = self._ociosas.get(chave)
+                if not livres:
+                    return None
+                sftp, transport = livres.pop()
+            if _conexao_saudavel(sftp, transport):
+                return sftp, transport
+            _fechar_conexao(sftp, transport)
+
+    def _devolver(self, chave, sftp, transport):
+        if not _conexao_saudavel(sftp, transport):
+            _fechar_conexao(sftp, transport)
+            return
+        with self._lock:
+            livres = self._ociosas.setdefault(chave, [])
+            if len(livres) < self.max_ociosas:
+                livres.append((sftp, transport))
+                return
+        _fechar_conexao(sftp, transport)
+
+    def executar(self, host: str, port: int, user: str, password: str, func, trace=TRACE_NULO):
+        """
+        func(sftp) com uma conexão do pool (ou nova).
+        Se a conexão reaproveitada tiver caído no meio do caminho, reconecta e
+        roda func de novo, uma vez; erros com a conexão viva sobem direto.
+        """
+        chave = (host, int(port), user)
+        conexao = self._pegar(chave)
+        reaproveitada = conexao is not None
+
+        while True:
+            if conexao is None:
+                conexao = conectar_sftp(host, port, user, password)
+                conexao[1].set_keepalive(self.keepalive)
+            trace.marcar("sftp_conexao", reaproveitada=reaproveitada)
+            sftp, transport = conexao
+
+            try:
+                resultado = func(sftp)
+            except Exception:
+                caiu = not _conexao_saudavel(sftp, transport)
+                if caiu:
+                    _fechar_conexao(sftp, transport)
+                else:
+                    self._devolver(chave, sftp, transport)
+                if caiu and reaproveitada:
+                    conexao, reaproveitada = None, False
+                    continue
+                raise
+
+            self._devolver(chave, sftp, transport)
+            return resultado
+
+    def fechar(self):
+        """Fecha todas as conexões paradas."""
+        with self._lock:
+            ociosas, self._ociosas = self._ociosas, {}
+        for livres in ociosas.values():
+            for sftp, transport in livres:
+                _fechar_conexao(sftp, transport)
+
+
+POOL_SFTP = PoolSFTP()
+
+
+def executar_sftp(host: str, port: int, user: str, password: str, func, trace=TRACE_NULO):
+    """func(sftp) numa conexão do pool global."""
+    return POOL_SFTP.executar(host, port, user, password, func, trace=trace)
+
+
+def ler_excel_sftp(
+    sftp, remote_path: str, sheet_name: str = "Sheet1", usar_cache: bool = True,
+    versao_atual=None, trace=TRACE_NULO
+) -> pd.DataFrame:
+    # cache local: só baixa/parseia de novo se mtime/size mudarem no servidor
+    # (None = planilha ainda na versao_atual, ver ler_excel_sftp_cache)
+    if usar_cache:
+        return ler_excel_sftp_cache(
+            sftp, remote_path, sheet_name=sheet_name, versao_atual=versao_atual, trace=trace
+        )
+
+    download = baixar_sftp(sftp, remote_path)
+    marcar_download(trace, download)
+
+    bio = io.BytesIO(download["dados"])
+    df = pd.read_excel(bio, sheet_name=sheet_name)
+    df.columns = [str(c).strip() for c in df.columns]
+    trace.marcar("parse_excel", len(df))
+    return df
+
+
+def carregar_planos_de_sftp(
+    sftp_url: str, sheet_name: str = "Sheet1", usar_cache: bool = True, versao_atual=None, trace=TRACE_NULO
+) -> pd.DataFrame:
+    load_dotenv()
+
+    # você pode deixar o password só no .env
+    password = os.getenv("PASSWORD_ADMIN_SFTP")
+    if not password:
+        raise RuntimeError("PASSWORD_ADMIN_SFTP não encontrado no .env")
+
+    host, port, user, remote_path = parse_sftp_url(sftp_url)
+
+    # conexão do pool (handshake só na primeira carga ou se ela tiver caído)
+    return executar_sftp(
+        host, port, user, password,
+        lambda sftp: ler_excel_sftp(
+            sftp, remote_path, sheet_name=sheet_name, usar_cache=usar_cache,
+            versao_atual=versao_atual, trace=trace,
+        ),
+        trace=trace,
+    )
@@ -0,0 +1,112 @@
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+
+# -----------------------
+# Snapshot binário colunar (.npz) de DataFrames
+# -----------------------
+# Layout (sem pickle):
+#   __meta__  -> JSON: colunas, tipo de cada coluna, attrs
+#   n:<i>     -> coluna numérica/bool, array NumPy direto
+#   c:<i>     -> coluna texto/mista: códigos int32 por linha
+#   t:<i>     -> ... texto de cada valor distinto
+#   k:<i>     -> ... tipo de cada valor distinto (p/ devolver float como float etc.)
+FORMATO = 1
+
+_STR, _FLOAT, _INT, _NULO, _BOOL = 0, 1, 2, 3, 4
+
+
+def _eh_numerica(serie: pd.Series) -> bool:
+    return isinstance(serie.dtype, np.dtype) and (
+        pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie)
+    )
+
+
+def codificar_valor(v):
+    if v is None or (isinstance(v, (float, np.floating)) and np.isnan(v)):
+        return _NULO, ""
+    if isinstance(v, (bool, np.bool_)):
+        return _BOOL, "1" if v else "0"
+    if isinstance(v, (int, np.integer)):
+        return _INT, str(int(v))
+    if isinstance(v, (float, np.floating)):
+        return _FLOAT, repr(float(v))
+    return _STR, str(v)
+
+
+def decodificar_valor(tipo: int, texto: str):
+    if tipo == _NULO:
+        return np.nan
+    if tipo == _BOOL:
+        return texto == "1"
+    if tipo == _INT:
+        return int(texto)
+    if tipo == _FLOAT:
+        return float(texto)
+    return texto
+
+
+def salvar_snapshot(df: pd.DataFrame, caminho: str):
+    """Grava df (valores + attrs) em caminho, de forma atômica."""
+    arrays = {}
+    tipos = []
+
+    for i, col in enumerate(df.columns):
+        serie = df[col]
+        if _eh_numerica(serie):
+            arrays[f"n:{i}"] = serie.to_numpy()
+            tipos.append("num")
+            continue
+
+        codigos, unicos = pd.factorize(serie.astype(object), use_na_sentinel=False)
+        cod_txt = [codificar_valor(u) for u in unicos]
+        arrays[f"c:{i}"] = codigos.astype(np.int32)
+        arrays[f"t:{i}"] = np.array([t for _, t in cod_txt], dtype=str)
+        arrays[f"k:{i}"] = np.array([k for k, _ in cod_txt], dtype=np.int8)
+        tipos.append("obj")
+
+    meta = {
+        "formato": FORMATO,
+        "colunas": [str(c) for c in df.columns],
+        "tipos": tipos,
+        "attrs": dict(df.attrs),
+    }
+    arrays["__meta__"] = np.array(json.dumps(meta, ensure_ascii=False, default=str))
+
+    pasta = os.path.dirname(os.path.abspath(caminho))
+    os.makedirs(pasta, exist_ok=True)
+    tmp = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, caminho)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def ler_snapshot(caminho: str) -> pd.DataFrame:
+    with np.load(caminho, allow_pickle=False) as z:
+        meta = json.loads(str(z["__meta__"]))
+        if meta.get("formato") != FORMATO:
+            raise ValueError(f"Snapshot em formato desconhecido: {meta.get('formato')}")
+
+        dados = {}
+        for i, (col, tipo) in enumerate(zip(meta["colunas"], meta["tipos"])):
+            if tipo == "num":
+                dados[col] = z[f"n:{i}"]
+                continue
+
+            textos = z[f"t:{i}"].tolist()
+            kinds = z[f"k:{i}"].tolist()
+            unicos = np.empty(len(textos), dtype=object)
+            for j, (k, t) in enumerate(zip(kinds, textos)):
+                unicos[j] = decodificar_valor(k, t)
+            dados[col] = pd.Series(unicos[z[f"c:{i}"]])
+
+    df = pd.DataFrame(dados, columns=meta["colunas"])
+    # JSON não tem tupla: volta as listas do attrs para tupla (ex.: versao_planilha)
+    df.attrs.update({k: tuple(v) if isinstance(v, list) else v for k, v in meta["attrs"].items()})
+    return df
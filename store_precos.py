@@ -0,0 +1,106 @@
+import os
+import mmap
+import json
+import struct
+import threading
+import numpy as np
+from indice_planos import IndicePlanos, MatrizPrecos
+
+# -----------------------
+# Store de preços em arquivo de layout fixo (lido via mmap)
+# -----------------------
+# Layout:
+#   [0:8)    MAGIC
+#   [8:16)   tamanho do cabeçalho JSON (uint64 little-endian)
+#   [16:..)  cabeçalho JSON: meta do índice/matriz + diretório dos arrays
+#            (dtype, shape, offset de cada um)
+#   ...      arrays crus, cada um alinhado em ALINHAMENTO bytes
+#
+# Cada worker abre o arquivo com mmap somente leitura e usa os arrays como
+# views (np.frombuffer): o page cache do SO guarda uma cópia só para todos
+# os processos, em vez de um DataFrame por worker.
+MAGIC = b"PRECOS01"
+ALINHAMENTO = 64
+
+_CABECALHO = struct.Struct("<8sQ")
+
+
+def _alinhar(n: int) -> int:
+    return (n + ALINHAMENTO - 1) // ALINHAMENTO * ALINHAMENTO
+
+
+def salvar_store(caminho: str, indice: IndicePlanos, matriz: MatrizPrecos = None, attrs: dict = None):
+    """Grava índice (+ matriz) em caminho, de forma atômica."""
+    arrays, meta_indice = indice.exportar()
+    arrays = {f"indice/{k}": np.ascontiguousarray(v) for k, v in arrays.items()}
+
+    meta = {"indice": meta_indice, "matriz": None, "attrs": attrs or {}}
+    if matriz is not None:
+        arrays_matriz, meta["matriz"] = matriz.exportar()
+        arrays.update({f"matriz/{k}": np.ascontiguousarray(v) for k, v in arrays_matriz.items()})
+
+    # offsets relativos ao início da área de dados (o cabeçalho muda de tamanho com eles)
+    diretorio = {}
+    pos = 0
+    for nome, arr in arrays.items():
+        diretorio[nome] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": pos}
+        pos = _alinhar(pos + arr.nbytes)
+    meta["arrays"] = diretorio
+
+    cabecalho = json.dumps(meta, ensure_ascii=False, default=str).encode("utf-8")
+    inicio_dados = _alinhar(_CABECALHO.size + len(cabecalho))
+
+    pasta = os.path.dirname(os.path.abspath(caminho))
+    os.makedirs(pasta, exist_ok=True)
+    tmp = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(_CABECALHO.pack(MAGIC, len(cabecalho)))
+            f.write(cabecalho)
+            for nome, arr in arrays.items():
+                f.seek(inicio_dados + diretorio[nome]["offset"])
+                f.write(arr.tobytes())
+            f.truncate(inicio_dados + pos)
+        os.replace(tmp, caminho)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def abrir_store(caminho: str):
+    """
+    Abre o store somente leitura, sem copiar os arrays para a memória do processo.
+    -> (IndicePlanos, MatrizPrecos ou None, attrs)
+    """
+    with open(caminho, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, tam = _CABECALHO.unpack_from(mm, 0)
+    if magic != MAGIC:
+        mm.close()
+        raise ValueError(f"Arquivo não é um store de preços: {caminho}")
+
+    meta = json.loads(bytes(mm[_CABECALHO.size:_CABECALHO.size + tam]).decode("utf-8"))
+    inicio_dados = _alinhar(_CABECALHO.size + tam)
+
+    # as views seguram a referência ao mmap: ele fica aberto enquanto o índice existir
+    arrays = {}
+    for nome, d in meta["arrays"].items():
+        dtype = np.dtype(d["dtype"])
+        qtd = int(np.prod(d["shape"], dtype=np.int64))
+        if qtd == 0:
+            arrays[nome] = np.empty(d["shape"], dtype=dtype)
+            continue
+        arr = np.frombuffer(mm, dtype=dtype, count=qtd, offset=inicio_dados + d["offset"])
+        arrays[nome] = arr.reshape(d["shape"])
+
+    def secao(prefixo):
+        return {k[len(prefixo):]: v for k, v in arrays.items() if k.startswith(prefixo)}
+
+    indice = IndicePlanos.importar(secao("indice/"), meta["indice"])
+    matriz = None
+    if meta["matriz"] is not None:
+        matriz = MatrizPrecos.importar(secao("matriz/"), meta["matriz"], indice)
+
+    attrs = {k: tuple(v) if isinstance(v, list) else v for k, v in meta["attrs"].items()}
+    return indice, matriz, attrs
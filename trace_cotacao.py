@@ -0,0 +1,145 @@
+import math
+import time
+import threading
+from collections import deque
+
+# -----------------------
+# Tempo por etapa das cotações
+# -----------------------
+# Cada chamada (cotação, busca de rede, carga de tabela) leva um TraceCotacao:
+# a cada etapa concluída o código chama trace.marcar("etapa", linhas=...), que
+# guarda o tempo desde a marca anterior. No fim, finalizar() entrega o trace ao
+# agregador, que mantém as últimas medidas de cada etapa e dá p50/p95/p99.
+JANELA_AGREGADOR = 2048  # medidas guardadas por (operação, etapa)
+PERCENTIS = (50, 95, 99)
+
+
+class TraceCotacao:
+    """Etapas de uma chamada, na ordem: {"etapa", "segundos", "linhas", ...extras}."""
+
+    ativo = True
+
+    def __init__(self, operacao: str, agregador=None):
+        self.operacao = operacao
+        self.agregador = AGREGADOR if agregador is None else agregador
+        self.etapas = []
+        self.total = None
+        self.inicio = self._ultima = time.perf_counter()
+
+    def marcar(self, etapa: str, linhas: int = None, **extras):
+        """Fecha `etapa` (tempo desde a última marca). extras: bytes, origem etc."""
+        agora = time.perf_counter()
+        self.etapas.append({"etapa": etapa, "segundos": agora - self._ultima, "linhas": linhas, **extras})
+        self._ultima = agora
+
+    def finalizar(self):
+        """Fecha o trace (uma vez só) e registra no agregador."""
+        if self.total is None:
+            self.total = time.perf_counter() - self.inicio
+            if self.agregador:
+                self.agregador.registrar(self)
+        return self
+
+    def como_dict(self) -> dict:
+        return {"operacao": self.operacao, "total_s": self.total, "etapas": list(self.etapas)}
+
+    def texto(self) -> str:
+        total = self.total if self.total is not None else time.perf_counter() - self.inicio
+        linhas = [f"{self.operacao}: {total * 1e3:.2f} ms"]
+        for e in self.etapas:
+            qtd = "" if e["linhas"] is None else f" ({e['linhas']} linhas)"
+            linhas.append(f"  {e['etapa']:<24} {e['segundos'] * 1e3:10.2f} ms{qtd}")
+        return "\n".join(linhas)
+
+
+class _TraceNulo:
+    """Trace que não mede nada (chamadas internas que não devem aparecer nos tempos)."""
+
+    ativo = False
+    etapas = ()
+    total = None
+
+    def marcar(self, etapa: str, linhas: int = None, **extras):
+        pass
+
+    def finalizar(self):
+        return self
+
+
+TRACE_NULO = _TraceNulo()
+
+
+# -----------------------
+# Agregador (p50/p95/p99 por operação e etapa)
+# -----------------------
+def _percentil(ordenados: list, p: float) -> float:
+    # nearest-rank
+    i = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[i]
+
+
+class AgregadorTempos:
+    """
+    Últimas `janela` medidas de cada (operação, etapa) e do total.
+    ao_registrar(func): func(trace) é chamada a cada trace finalizado
+    (ex.: mandar para métricas/log). Thread-safe.
+    """
+
+    def __init__(self, janela: int = JANELA_AGREGADOR):
+        self.janela = janela
+        self._amostras = {}  # operação -> {etapa: deque de segundos}
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def registrar(self, trace: TraceCotacao):
+        with self._lock:
+            etapas = self._amostras.setdefault(trace.operacao, {})
+            for e in trace.etapas:
+                etapas.setdefault(e["etapa"], deque(maxlen=self.janela)).append(e["segundos"])
+            etapas.setdefault("total", deque(maxlen=self.janela)).append(trace.total)
+            callbacks = list(self._callbacks)
+
+        for func in callbacks:
+            try:
+                func(trace)
+            except Exception as e:
+                print(f"[ERRO] Callback de tempos falhou: {type(e).__name__}: {e}")
+
+    def ao_registrar(self, func):
+        """Registra func(trace); devolve func (dá para usar como decorator)."""
+        with self._lock:
+            self._callbacks.append(func)
+        return func
+
+    def resumo(self) -> dict:
+        """-> {operação: {etapa: {"n", "p50_ms", "p95_ms", "p99_ms", "max_ms"}}}"""
+        with self._lock:
+            copia = {op: {et: list(v) for et, v in etapas.items()} for op, etapas in self._amostras.items()}
+
+        saida = {}
+        for op, etapas in copia.items():
+            saida[op] = {}
+            for etapa, valores in etapas.items():
+                ordenados = sorted(valores)
+                estat = {"n": len(ordenados)}
+                for p in PERCENTIS:
+                    estat[f"p{p}_ms"] = round(_percentil(ordenados, p) * 1e3, 3)
+                estat["max_ms"] = round(ordenados[-1] * 1e3, 3)
+                saida[op][etapa] = estat
+        return saida
+
+    def texto(self) -> str:
+        linhas = []
+        for op, etapas in sorted(self.resumo().items()):
+            linhas.append(op)
+            for etapa, e in etapas.items():
+                percentis = "  ".join(f"p{p} {e[f'p{p}_ms']:9.2f}" for p in PERCENTIS)
+                linhas.append(f"  {etapa:<24} n={e['n']:<6} {percentis}  max {e['max_ms']:9.2f} ms")
+        return "\n".join(linhas)
+
+    def limpar(self):
+        with self._lock:
+            self._amostras.clear()
+
+
+AGREGADOR = AgregadorTempos()